@@ -0,0 +1,195 @@
+"""Benchmarks of tracing throughput and flush latency
+
+By default trackers work with a stand-in client that keeps table schema in memory
+and only records sizes of inserted payloads, so the benchmarks measure the client side
+overhead of rarog. Pass `--port` to run the same scenarios against a local ClickHouse.
+
+Usage:
+    python benchmarks/bench_tracker.py [--steps 10000] [--port 9000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from rarog import Tracker
+from rarog.core import MetricTypes, check_value, python_type_to_click, value_nbytes
+
+
+class RecordingTracker(Tracker):
+    """Tracker that doesn't send queries to the database, only records their payloads"""
+
+    def __init__(self, *args, **kwargs):
+        self.queries = []
+        self.columns = {'time': 'DateTime', 'step': 'UInt32', 'phase': 'String',
+                        'rank': 'UInt16'}
+        super().__init__(*args, **kwargs)
+
+    def execute(self, query, params=None, *args, **kwargs):
+        payload_nbytes = 0
+        if query.startswith('INSERT'):
+            # estimate by the first value of the column to keep overhead of the stand-in low
+            payload_nbytes = sum(value_nbytes(column[0]) * len(column) for column in params)
+        elif query.startswith('ALTER'):
+            self.columns.update(
+                (column.split()[-2], column.split()[-1]) for column in query.split(','))
+        self.queries.append((query.split()[0], payload_nbytes))
+        if query.startswith('DESCRIBE'):
+            return [(name, data_type) for name, data_type in self.columns.items()]
+        return []
+
+    def disconnect(self):
+        pass
+
+
+class Result:
+    def __init__(self, name, values, seconds, latencies, peak_nbytes, queries=None):
+        self.name = name
+        self.values = values
+        self.seconds = seconds
+        self.latencies = np.asarray(latencies)
+        self.peak_nbytes = peak_nbytes
+        self.queries = queries
+
+    def row(self):
+        inserts = [nbytes for kind, nbytes in self.queries or [] if kind == 'INSERT']
+        return [
+            self.name,
+            '{:,.0f}'.format(self.values / self.seconds),
+            '{:.1f}'.format(np.percentile(self.latencies, 50) * 1e6),
+            '{:.1f}'.format(np.percentile(self.latencies, 99) * 1e6),
+            '{:.2f}'.format(self.peak_nbytes / 2 ** 20),
+            str(len(inserts)) if self.queries is not None else '-',
+            '{:.1f}'.format(sum(inserts) / 2 ** 10) if self.queries is not None else '-',
+        ]
+
+
+HEADER = ['scenario', 'records/sec', 'p50, us', 'p99, us', 'peak, MiB', 'inserts',
+          'payload, KiB']
+
+
+def measure(name, calls, values_per_call, make_tracker=None):
+    """Measure latency of every call and peak memory of the whole run
+
+    Calls are executed twice: first time to measure time, second time under
+    tracemalloc, because tracing of memory allocations slows calls down.
+
+    Args:
+        name (str): name of the scenario
+        calls (callable): function that receives tracker and returns iterable of calls
+        values_per_call (int): number of traced or checked values in every call
+        make_tracker (callable): function that returns a new tracker
+    """
+    latencies = []
+    tracker = make_tracker() if make_tracker else None
+    gc.collect()
+    start = time.perf_counter()
+    for call in calls(tracker):
+        call_start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_start)
+    seconds = time.perf_counter() - start
+    queries = getattr(tracker, 'queries', None)
+    if tracker is not None:
+        tracker.close()
+
+    tracker = make_tracker() if make_tracker else None
+    tracemalloc.start()
+    for call in calls(tracker):
+        call()
+    _, peak_nbytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if tracker is not None:
+        tracker.close()
+    return Result(name, len(latencies) * values_per_call, seconds, latencies, peak_nbytes,
+                  queries)
+
+
+def scenarios(steps, tracker_factory):
+    metrics = {'metric_{}'.format(idx): float(idx) for idx in range(10)}
+    wide_metrics = {'metric_{}'.format(idx): float(idx) for idx in range(200)}
+    big_list = list(range(10 ** 5))
+    big_array = np.arange(10 ** 5, dtype=np.float32)
+    metric_types = MetricTypes()
+    metric_types.check('list', big_list)
+
+    def trace_calls(tracker):
+        return (lambda step=step: tracker.trace('loss', 0.5, step=step) for step in range(steps))
+
+    def multy_trace_calls(tracker):
+        return (lambda step=step: tracker.multy_trace(metrics, step=step)
+                for step in range(steps))
+
+    def flush_calls(tracker):
+        for step in range(steps):
+            tracker.multy_trace(wide_metrics, step=step)
+        return [tracker.flush]
+
+    return [
+        ('trace', trace_calls, 1, tracker_factory()),
+        ('multy_trace', multy_trace_calls, len(metrics), tracker_factory()),
+        ('trace, sync_step=1000', trace_calls, 1, tracker_factory(sync_step=1000)),
+        ('multy_trace, sync_step=1000', multy_trace_calls, len(metrics),
+         tracker_factory(sync_step=1000)),
+        ('multy_trace, sync_seconds=1', multy_trace_calls, len(metrics),
+         tracker_factory(sync_seconds=1)),
+        ('multy_trace, async_flush', multy_trace_calls, len(metrics),
+         tracker_factory(sync_step=1000, async_flush=True)),
+        ('flush of 200 metrics', flush_calls, steps * len(wide_metrics),
+         tracker_factory(sync_step=10 * steps)),
+        ('python_type_to_click, list', lambda _: [lambda: python_type_to_click(big_list)],
+         len(big_list), None),
+        ('python_type_to_click, array', lambda _: [lambda: python_type_to_click(big_array)],
+         len(big_array), None),
+        ('check_value, list', lambda _: [lambda: check_value(big_list)], len(big_list), None),
+        ('check_value, array', lambda _: [lambda: check_value(big_array)], len(big_array),
+         None),
+        ('MetricTypes.check, list', lambda _: [lambda: metric_types.check('list', big_list)],
+         len(big_list), None),
+    ]
+
+
+def print_table(rows):
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(rows[0]))]
+    for row in rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--steps', type=int, default=10000, help='number of traced steps')
+    parser.add_argument('--host', default='localhost', help='ClickHouse host')
+    parser.add_argument('--port', type=int, help='run against ClickHouse on this port')
+    args = parser.parse_args()
+
+    counter = iter(range(10 ** 6))
+    created = []
+
+    def tracker_factory(**kwargs):
+        def make_tracker():
+            name = 'rarog_benchmark_{}'.format(next(counter))
+            if args.port is None:
+                return RecordingTracker(name, **kwargs)
+            tracker = Tracker(name, host=args.host, port=args.port, **kwargs)
+            created.append(name)
+            return tracker
+        return make_tracker
+
+    rows = [HEADER]
+    try:
+        for name, calls, values_per_call, make_tracker in scenarios(args.steps,
+                                                                    tracker_factory):
+            rows.append(measure(name, calls, values_per_call, make_tracker).row())
+    finally:
+        if created:
+            from rarog import Manager
+            manager = Manager(host=args.host, port=args.port)
+            for name in created:
+                manager.remove_experiment(name)
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
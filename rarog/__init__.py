@@ -1,3 +1,16 @@
-from .core import RarogException, Manager, Tracker  # noqa
+import sys
 
 __version__ = '0.1.dev1'
+
+__all__ = ['RarogException', 'Histogram', 'Manager', 'Tracker']
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # numpy and the database driver are imported only when rarog is actually used
+        if name in __all__:
+            from . import core
+            return getattr(core, name)
+        raise AttributeError('module {module!r} has no attribute {name!r}'.format(
+            module=__name__, name=name))
+else:
+    from .core import RarogException, Histogram, Manager, Tracker  # noqa
@@ -0,0 +1,165 @@
+"""Asyncio interface of the manager and tracker
+
+Blocking calls of `Manager` and `Tracker` are executed in a dedicated thread, so network
+I/O doesn't stall the event loop. Every object has its own single thread, thus calls are
+executed in the order they were awaited and the wrapped object is never used concurrently.
+Requires python 3.5 or later.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .core import Manager, Tracker
+
+
+class _AsyncWrapper:
+    """Execute methods of the lazily created object in a dedicated thread"""
+
+    def __init__(self, factory):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # object is created in the same thread, so its creation doesn't block the loop
+        self._wrapped = self._executor.submit(factory)
+
+    async def _run(self, function, *args, **kwargs):
+        """Call function with the wrapped object as the first argument in the thread"""
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, partial(self._call, function, args, kwargs))
+
+    def _call(self, function, args, kwargs):
+        return function(self._wrapped.result(), *args, **kwargs)
+
+
+class AsyncManager(_AsyncWrapper):
+    """Asyncio version of the `Manager`"""
+
+    def __init__(self, host='localhost', *args, **kwargs):
+        """
+        Args:
+            host (str): database host
+            args, kwargs: other arguments of the `Manager`
+        """
+        self.manager = Manager(host, *args, **kwargs)
+        super().__init__(lambda: self.manager)
+
+    async def list_experiments(self):
+        """Show available experiments"""
+        return await self._run(Manager.list_experiments)
+
+    async def remove_experiment(self, name):
+        """Remove experiment by name
+
+        Args:
+            name (str): name of experiment to be deleted
+
+        Raises:
+            RarogException: if experiment was not found in database
+        """
+        return await self._run(Manager.remove_experiment, name)
+
+    async def replay_log(self, path, name=None, remove=False):
+        """Write records of the local log that are not in the database yet
+
+        Args:
+            path (str): path to the log written by tracker with `wal_path`
+            name (str): name of experiment, name from the log header by default
+            remove (bool): remove log after all records were written
+        """
+        return await self._run(Manager.replay_log, path, name=name, remove=remove)
+
+    def tracker(self, name, **kwargs):
+        """Create async tracker that shares connection pool with the manager
+
+        Args:
+            name (str): name of experiment to be logged
+            kwargs: other arguments of the `Tracker`
+        """
+        return AsyncTracker(name, pool=self.manager._shared_pool(),
+                            **self.manager._connection_kwargs, **kwargs)
+
+    async def close(self):
+        """Disconnect from the database and stop the thread of the manager"""
+        try:
+            await self._run(Manager.disconnect)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class AsyncTracker(_AsyncWrapper):
+    """Asyncio version of the `Tracker`
+
+    Tracker is created in the background, errors of its creation, e.g. already existing
+    experiment, are raised by the first awaited call.
+    """
+
+    def __init__(self, name, *args, **kwargs):
+        """
+        Args:
+            name (str): name of experiment to be logged
+            args, kwargs: other arguments of the `Tracker`
+        """
+        self.table = name
+        super().__init__(partial(Tracker, name, *args, **kwargs))
+
+    def __repr__(self):
+        return '{class_name}:{table_name}'.format(
+            class_name=self.__class__.__name__, table_name=self.table)
+
+    async def trace(self, name, value, step, phase='train', rank=None):
+        """Log metric by name by batches or straightway
+
+        Args:
+            name (str): name of the metric
+            value (int, float, ..): value of the metric
+            step (int): increment
+            phase (str): phase of the experiment
+            rank (int): rank of the process that traced the value
+        """
+        await self._run(Tracker.trace, name, value, step, phase=phase, rank=rank)
+
+    async def multy_trace(self, names_to_values, step, phase='train', rank=None):
+        """Log several metrics
+
+        Args:
+            names_to_values (dict): metric name to value mapping
+            step (int): increment
+            phase (str): phase of the experiment
+            rank (int): rank of the process that traced values
+        """
+        await self._run(Tracker.multy_trace, names_to_values, step, phase=phase, rank=rank)
+
+    async def flush(self):
+        """Write all traced values to the database"""
+        await self._run(Tracker.flush)
+
+    async def read(self, *args, **kwargs):
+        """Read values of metrics from the database, see `Tracker.read`"""
+        return await self._run(Tracker.read, *args, **kwargs)
+
+    async def metrics(self):
+        """Return existing metrics in the experiment"""
+        return await self._run(lambda tracker: tracker.metrics)
+
+    async def stats(self):
+        """Return snapshot of the tracker counters, see `Tracker.stats`"""
+        return await self._run(Tracker.stats)
+
+    async def close(self):
+        """Flush traced values, disconnect from the database and stop the thread
+        of the tracker
+        """
+        try:
+            await self._run(Tracker.close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
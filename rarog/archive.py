@@ -0,0 +1,167 @@
+"""Export and import of experiments as Parquet files
+
+Rows are streamed by blocks in both directions, so memory usage doesn't depend on
+the size of the experiment. Statement that created the experiment table is kept in
+the file metadata, and the table is created with it on import. Requires pyarrow and
+clickhouse-driver 0.2.11 or later, which streams blocks as Arrow record batches,
+`pip install rarog[parquet]`.
+"""
+import re
+
+import numpy as np
+
+from .core import RarogException
+
+
+CREATE_TABLE_KEY = b'rarog.create_table'
+NAME_KEY = b'rarog.name'
+
+
+def import_pyarrow():
+    """Return pyarrow and its parquet module
+
+    Raises:
+        RarogException: if pyarrow is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RarogException('Export and import require pyarrow, `pip install rarog[parquet]`')
+    return pyarrow, pyarrow.parquet
+
+
+def click_type_to_arrow(data_type):
+    """Convert clickhouse data type to pyarrow one, DateTime is stored in seconds
+
+    Raises:
+        RarogException: if data type is not supported
+    """
+    pa, _ = import_pyarrow()
+    wrapped = re.match(r'^(LowCardinality|Nullable)\((.*)\)$', data_type)
+    if wrapped is not None:
+        return click_type_to_arrow(wrapped.group(2))
+    inner = re.match(r'^Array\((.*)\)$', data_type)
+    if inner is not None:
+        return pa.list_(click_type_to_arrow(inner.group(1)))
+    if re.match(r'^(U?Int|Float)\d+$', data_type):
+        return getattr(pa, data_type.lower())()
+    if data_type == 'String':
+        return pa.string()
+    if data_type == 'DateTime':
+        return pa.timestamp('s')
+    if data_type == 'Date':
+        return pa.date32()
+    raise RarogException('Data type {data_type} can not be exported'.format(data_type=data_type))
+
+
+def export_experiment(manager, name, path, block_rows=65536):
+    """Stream rows of the experiment table to the Parquet file
+
+    Args:
+        manager (rarog.Manager): manager connected to the database
+        name (str): name of the experiment
+        path (str): path to the created file
+        block_rows (int): number of rows in a block of the stream and a row group
+
+    Returns:
+        int: number of exported rows
+    """
+    pa, pq = import_pyarrow()
+    columns = [
+        (col[0], col[1])
+        for col in manager.execute('DESCRIBE TABLE {name}'.format(name=name))
+        if col[2] not in ('MATERIALIZED', 'ALIAS')]
+    create_query = manager.execute('SHOW CREATE TABLE {name}'.format(name=name))[0][0]
+    schema = pa.schema(
+        [pa.field(column, click_type_to_arrow(data_type)) for column, data_type in columns],
+        metadata={CREATE_TABLE_KEY: create_query.encode(), NAME_KEY: name.encode()})
+    # timestamps are passed as numbers, so they don't depend on time zones
+    query = 'SELECT {columns} FROM {name}'.format(
+        name=name, columns=', '.join(
+            'toUInt32({column})'.format(column=column) if data_type == 'DateTime' else column
+            for column, data_type in columns))
+    exported = 0
+    with manager._connection() as client, pq.ParquetWriter(path, schema) as writer:
+        # blocks of the database are received as Arrow record batches, column by column
+        for batch in client.query_arrow_stream(query, settings={'max_block_size': block_rows}):
+            if not batch.num_rows:
+                continue
+            writer.write_table(pa.Table.from_arrays(
+                [to_arrow_column(column, field.type)
+                 for column, field in zip(batch.columns, schema)], schema=schema))
+            exported += batch.num_rows
+    return exported
+
+
+def to_arrow_column(column, data_type):
+    """Cast column of the received record batch to the type of the exported field"""
+    pa, _ = import_pyarrow()
+    if pa.types.is_timestamp(data_type) and not pa.types.is_timestamp(column.type):
+        column = column.cast(pa.int64())
+    return column.cast(data_type)
+
+
+def to_insert_column(column):
+    """Convert Arrow column to values of the columnar insert
+
+    Values are converted through numpy arrays, nested arrays are split from the flat
+    array of their values by offsets, nulls are restored only where they are.
+    """
+    pa, _ = import_pyarrow()
+    # parquet keeps timestamps at least in milliseconds
+    if pa.types.is_timestamp(column.type):
+        column = column.cast(pa.timestamp('s')).cast(pa.int64())
+    if pa.types.is_list(column.type) and len(column):
+        flat = column.flatten().to_numpy(zero_copy_only=False)
+        offsets = column.offsets.to_numpy()
+        # offsets of a sliced array don't start from zero
+        return np.split(flat, offsets[1:-1] - offsets[0])
+    if not column.null_count:
+        return column.to_numpy(zero_copy_only=False).tolist()
+    nulls = np.flatnonzero(column.is_null().to_numpy(zero_copy_only=False))
+    values = column.fill_null(pa.scalar(0).cast(column.type)).to_numpy(
+        zero_copy_only=False).tolist()
+    for idx in nulls.tolist():
+        values[idx] = None
+    return values
+
+
+def import_experiment(manager, path, name=None, block_rows=65536, exist_ok=False):
+    """Create the experiment table and insert rows of the Parquet file by blocks
+
+    Args:
+        manager (rarog.Manager): manager connected to the database
+        path (str): path to the file created by `export_experiment`
+        name (str): name of the experiment, exported name by default
+        block_rows (int): number of rows inserted with one query
+        exist_ok (bool): if `False` raises an exception if the experiment already exists
+
+    Returns:
+        int: number of imported rows
+
+    Raises:
+        RarogException: if file was not created by export or experiment already exists
+    """
+    _, pq = import_pyarrow()
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.schema_arrow.metadata or {}
+    if CREATE_TABLE_KEY not in metadata:
+        raise RarogException('File `{path}` is not an exported experiment'.format(path=path))
+    if name is None:
+        name = metadata[NAME_KEY].decode()
+    create_query = re.sub(r'^CREATE TABLE \S+', 'CREATE TABLE {name}'.format(name=name),
+                          metadata[CREATE_TABLE_KEY].decode())
+    if name in manager.list_experiments():
+        if not exist_ok:
+            raise RarogException('Experiment `{name}` already exists'.format(name=name))
+    else:
+        manager.execute(create_query)
+    insert_query = 'INSERT INTO {name} ({columns}) VALUES'.format(
+        name=name, columns=', '.join(parquet_file.schema_arrow.names))
+    imported = 0
+    for batch in parquet_file.iter_batches(batch_size=block_rows):
+        manager.execute(insert_query, [to_insert_column(column) for column in batch.columns],
+                        columnar=True)
+        imported += batch.num_rows
+    return imported
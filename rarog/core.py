@@ -1,10 +1,20 @@
+import contextlib
+import copy
 import datetime
-from collections import defaultdict
-from time import time
+import itertools
+import math
+import os
+import pickle
+import queue
+import re
+import threading
+from time import perf_counter, sleep, time
 
-import numpy as np
-from clickhouse_driver import Client
-from clickhouse_driver import errors as click_errors
+from .reducers import REDUCERS
+from .samplers import Sampler
+
+# numpy takes a noticeable part of the start of short jobs, so it is imported by functions
+# that use it, paths of python scalars don't import it at all
 
 
 PYTHON_DATATYPE_TO_CLICKHOUSE = {
@@ -18,23 +28,80 @@ PYTHON_DATATYPE_TO_CLICKHOUSE = {
 }
 
 
+# columns of the experiment table that are not metrics
+SERVICE_COLUMNS = ('time', 'step', 'phase', 'rank')
+
+# columns of the narrow experiment table that keep metrics names, types and values
+NARROW_COLUMNS = ('metric', 'type', 'value_float', 'value_int', 'value_string', 'value_array')
+
+# presets of the experiment table engine, partitioning and ordering, see `Tracker`
+TABLE_LAYOUTS = {
+    'summing': {
+        'engine': 'SummingMergeTree()', 'partition_by': 'toYYYYMMDD(time)',
+        'order_by': ('step', 'phase'), 'final': False},
+    'replacing': {
+        'engine': 'ReplacingMergeTree(time)', 'partition_by': 'toYYYYMM(time)',
+        'order_by': ('phase', 'step'), 'final': True},
+    'replacing_unpartitioned': {
+        'engine': 'ReplacingMergeTree(time)', 'partition_by': None,
+        'order_by': ('phase', 'step'), 'final': True},
+    'memory': {'engine': 'Memory()', 'partition_by': None, 'order_by': None, 'final': False},
+    'log': {'engine': 'Log()', 'partition_by': None, 'order_by': None, 'final': False},
+}
+
+# rollup tables of the experiment are named as `<experiment><ROLLUP_SEPARATOR><bucket size>`
+ROLLUP_SEPARATOR = '__rollup_'
+# aggregates of every numeric metric kept by rollup tables
+ROLLUP_FUNCTIONS = ('min', 'max', 'sum', 'count')
+
+# pause before the next attempt to write values from the local log after connection error
+WAL_RETRY_SECONDS = 30
+
+# maximum number of rows written with one query, when values are read from the local log
+WAL_BATCH_ROWS = 100000
+
+# tables created or checked by trackers of the process, keyed by connection and name
+CREATED_TABLES = set()
+
+# suffixes of columns that store arrays with several dimensions and histograms
+SHAPE_SUFFIX = '__shape'
+COUNTS_SUFFIX = '__counts'
+EDGES_SUFFIX = '__edges'
+
 NUMPY_DATATYPE_TO_CLICKHOUSE = {
-    np.dtype('bool'): 'UInt8',
-    np.dtype('int8'): 'Int8',
-    np.dtype('int16'): 'Int16',
-    np.dtype('int32'): 'Int32',
-    np.dtype('int64'): 'Int64',
-    np.dtype('uint8'): 'UInt8',
-    np.dtype('uint16'): 'UInt16',
-    np.dtype('uint32'): 'UInt32',
-    np.dtype('uint64'): 'UInt64',
-    np.dtype('float32'): 'Float32',
-    np.dtype('float64'): 'Float64',
+    'bool': 'UInt8',
+    'int8': 'Int8',
+    'int16': 'Int16',
+    'int32': 'Int32',
+    'int64': 'Int64',
+    'uint8': 'UInt8',
+    'uint16': 'UInt16',
+    'uint32': 'UInt32',
+    'uint64': 'UInt64',
+    'float32': 'Float32',
+    'float64': 'Float64',
 }
 
 
+def import_click_errors():
+    """Return errors module of the clickhouse driver, the driver is imported on the
+    first query, so it doesn't slow down the start of the process
+    """
+    from clickhouse_driver import errors
+    return errors
+
+
+def connection_errors():
+    """Return errors after which values may be written later, when the database is
+    available again
+    """
+    errors = import_click_errors()
+    return (errors.NetworkError, errors.SocketTimeoutError, EOFError)
+
+
 def python_type_to_click(value):
     """Convert python data type to clickhouse"""
+    import numpy as np
     error_msg = "Data type {data_type} is not supported"
     if isinstance(value, np.ndarray):
         if value.ndim > 1:
@@ -42,7 +109,7 @@ def python_type_to_click(value):
                 "Numpy arrays with dimensions more than one are not supported")
         try:
             return 'Array({inner_type})'.format(
-                inner_type=NUMPY_DATATYPE_TO_CLICKHOUSE[value.dtype])
+                inner_type=NUMPY_DATATYPE_TO_CLICKHOUSE[value.dtype.name])
         except KeyError:
             raise NotImplementedError(error_msg.format(data_type=value.dtype))
     if isinstance(value, (list, tuple, set)):
@@ -62,6 +129,7 @@ def python_type_to_click(value):
 
 def check_value(value):
     """Check that value can be stored in the database"""
+    import numpy as np
     if isinstance(value, np.ndarray):
         if value.ndim > 1:
             raise NotImplementedError(
@@ -69,19 +137,664 @@ def check_value(value):
     return value
 
 
+def to_numpy(value):
+    """Convert tensor or any object that supports array interface to numpy array
+
+    Tensors of pytorch are detached and moved to the cpu, tensors of tensorflow are
+    converted with their `numpy` method, other objects with the buffer protocol or
+    array interface. Returned array may share memory with cpu tensors, `expand_values`
+    copies it before the value is kept.
+    """
+    import numpy as np
+    if isinstance(value, np.ndarray):
+        return value
+    if hasattr(value, 'detach'):
+        return value.detach().cpu().numpy()
+    if callable(getattr(value, 'numpy', None)):
+        return np.asarray(value.numpy())
+    return np.asarray(value)
+
+
+def is_plain_value(value):
+    """Check that value is stored in the database as is, without conversion"""
+    if type(value) in PYTHON_DATATYPE_TO_CLICKHOUSE or isinstance(value, (list, tuple, set)):
+        return True
+    import numpy as np
+    return isinstance(value, np.ndarray) and value.ndim == 1
+
+
+def copy_plain_arrays(names_to_values):
+    """Copy 1d numpy arrays that are stored as is, so values may be kept until the flush
+    while the caller updates its arrays in place
+
+    Returns:
+        dict: metric name to value mapping, the same mapping if nothing was copied
+    """
+    import numpy as np
+    if not any(type(value) is np.ndarray and value.ndim == 1
+               for value in names_to_values.values()):
+        return names_to_values
+    return {
+        name: value.copy() if type(value) is np.ndarray and value.ndim == 1 else value
+        for name, value in names_to_values.items()}
+
+
+def expand_values(names_to_values):
+    """Convert values of metrics to the ones that may be stored in the database
+
+    Arrays and tensors with several dimensions are stored as a flat array and its shape
+    in the `<name>__shape` column, histograms as `<name>__counts` and `<name>__edges`,
+    scalar tensors as python numbers. Arrays are copied, so values may be kept until
+    the flush while the caller updates its tensors in place.
+
+    Args:
+        names_to_values (dict): metric name to value mapping
+
+    Returns:
+        dict: metric name to value mapping, the same mapping if nothing was converted
+    """
+    import numpy as np
+    expanded = None
+    for name, value in names_to_values.items():
+        if is_plain_value(value):
+            continue
+        if isinstance(value, Histogram):
+            columns = {name + COUNTS_SUFFIX: value.counts, name + EDGES_SUFFIX: value.edges}
+        else:
+            array = to_numpy(value)
+            if array.ndim == 0:
+                columns = {name: array.item()}
+            else:
+                # reshape of contiguous array is a view of the tensor memory
+                flat = array.reshape(-1)
+                if np.may_share_memory(flat, array):
+                    flat = flat.copy()
+                columns = {name: flat}
+                if array.ndim > 1:
+                    columns[name + SHAPE_SUFFIX] = np.asarray(array.shape, dtype=np.uint32)
+        if expanded is None:
+            expanded = dict(names_to_values)
+        del expanded[name]
+        expanded.update(columns)
+    return names_to_values if expanded is None else expanded
+
+
+class Histogram:
+    """Distribution of values binned on the client side
+
+    Only counts and edges of the bins are sent to the database, so the size of the
+    record doesn't depend on the number of values.
+    """
+
+    def __init__(self, values, bins=64, range=None):
+        """
+        Args:
+            values (array-like or tensor): values of any shape
+            bins (int or sequence): number of equal-width bins or their edges
+            range (tuple(float, float)): lower and upper range of the bins,
+                minimum and maximum of values by default
+        """
+        import numpy as np
+        array = to_numpy(values).reshape(-1)
+        counts, edges = np.histogram(array, bins=bins, range=range)
+        self.counts = counts.astype(np.uint64)
+        self.edges = edges.astype(np.float64)
+
+    def __repr__(self):
+        return '{class_name}(bins={bins})'.format(
+            class_name=self.__class__.__name__, bins=len(self.counts))
+
+
+def is_compatible_click_type(column_type, data_type):
+    """Check that values of data type may be written to the column of another type,
+    numeric values are accepted by float columns, booleans by any numeric column
+    """
+    if column_type == data_type:
+        return True
+    if data_type == PYTHON_DATATYPE_TO_CLICKHOUSE[bool] and is_numeric_click_type(column_type):
+        return True
+    inner = re.match(r'^Array\((.*)\)$', column_type)
+    if inner is not None:
+        inner_data = re.match(r'^Array\((.*)\)$', data_type)
+        return inner_data is not None and is_compatible_click_type(
+            inner.group(1), inner_data.group(1))
+    return column_type.startswith('Float') and is_numeric_click_type(data_type)
+
+
+class MetricTypes:
+    """Cache of clickhouse types of metrics resolved on the first value of every metric
+
+    Later values are validated against the cached type without python loops over their
+    elements: arrays by dtype and number of dimensions, iterables are converted to
+    numpy arrays and checked in the same way, iterables of strings by the set of types
+    of their elements. Only values that don't pass these checks are resolved from scratch.
+    """
+
+    def __init__(self):
+        # metric name to (clickhouse type, python type, dtype or element type)
+        self.__types = {}
+
+    def __contains__(self, name):
+        return name in self.__types
+
+    def get(self, name):
+        """Return cached clickhouse type of the metric"""
+        return self.__types[name][0]
+
+    def check(self, name, value):
+        """Check that value can be stored in the column of the metric
+
+        Returns:
+            value: checked value
+
+        Raises:
+            NotImplementedError: if value can't be stored in the database
+            RarogException: if type of value doesn't match type of previous values
+        """
+        cached = self.__types.get(name)
+        if cached is not None and self.__matches(value, cached[1], cached[2]):
+            return value
+        data_type = python_type_to_click(value)
+        if cached is None:
+            import numpy as np
+            if isinstance(value, np.ndarray):
+                inner_type = value.dtype
+            elif isinstance(value, (list, tuple, set)):
+                inner_type = np.asarray(list(value)).dtype
+            else:
+                inner_type = None
+            self.__types[name] = (data_type, type(value), inner_type)
+        elif not is_compatible_click_type(cached[0], data_type):
+            raise RarogException(
+                'Metric `{name}` has type {column_type}, value of type {data_type} can not '
+                'be stored'.format(name=name, column_type=cached[0], data_type=data_type))
+        return value
+
+    @staticmethod
+    def __matches(value, python_type, dtype):
+        if type(value) is not python_type:
+            return False
+        if dtype is None:
+            return True
+        import numpy as np
+        if python_type is not np.ndarray:
+            if not value or dtype.kind == 'O':
+                # types of objects, e.g. dates, are checked element by element from scratch
+                return False
+            if dtype.kind in 'US':
+                # numbers are converted to strings by numpy, so types of elements are compared
+                return set(map(type, value)) == {str if dtype.kind == 'U' else bytes}
+            try:
+                value = np.asarray(list(value) if python_type is set else value)
+            except ValueError:
+                # nested sequences of different lengths
+                return False
+        return value.dtype == dtype and value.ndim == 1
+
+
+def narrow_value_column(data_type):
+    """Return column of the narrow table that stores values of the data type
+
+    Raises:
+        RarogException: if values of the data type can't be stored in the narrow table
+    """
+    if data_type.startswith('Float'):
+        return 'value_float'
+    if is_numeric_click_type(data_type):
+        return 'value_int'
+    if data_type == 'String':
+        return 'value_string'
+    inner = re.match(r'^Array\((.*)\)$', data_type)
+    if inner is not None and is_numeric_click_type(inner.group(1)):
+        return 'value_array'
+    raise RarogException('Values of type {data_type} are not supported by narrow storage'.format(
+        data_type=data_type))
+
+
+def click_column_codec(data_type):
+    """Return compression codec clause suitable for the metric column of the data type"""
+    if data_type.startswith('Float'):
+        # consecutive values of float metrics are close, so XOR with the previous is small
+        return ' CODEC(Gorilla, LZ4)'
+    if data_type.startswith('Array('):
+        return ' CODEC(ZSTD)'
+    return ''
+
+
+def is_numeric_click_type(data_type):
+    """Check that clickhouse data type is a numeric scalar"""
+    return re.match(r'^(U?Int|Float)\d+$', data_type) is not None
+
+
+def metric_column_type(data_type):
+    """Return type of the wide table column that stores values of the data type
+
+    Numeric columns are nullable, so rows without the metric are not mistaken for zeros
+    by aggregations and rollups.
+    """
+    if is_numeric_click_type(data_type):
+        return 'Nullable({data_type})'.format(data_type=data_type)
+    return data_type
+
+
+def strip_nullable(data_type):
+    """Return type of values of the possibly nullable column"""
+    nullable = re.match(r'^Nullable\((.*)\)$', data_type)
+    return data_type if nullable is None else nullable.group(1)
+
+
+def click_column_to_numpy(values, data_type):
+    """Convert column of values returned by the database to numpy array
+
+    Args:
+        values (list): values of the column
+        data_type (str): clickhouse data type of the column
+    """
+    import numpy as np
+    if is_numeric_click_type(data_type):
+        return np.asarray(values, dtype=np.dtype(data_type.lower()))
+    array = np.empty(len(values), dtype=object)
+    for idx, value in enumerate(values):
+        array[idx] = value
+    return array
+
+
+def where_clause(conditions):
+    """Join conditions of the query into WHERE clause"""
+    return 'WHERE {}'.format(' AND '.join(conditions)) if conditions else ''
+
+
+def value_nbytes(value):
+    """Approximate number of bytes required to store the value"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (list, tuple, set)):
+        return 8 * len(value)
+    if isinstance(value, (int, float)):
+        return 8
+    import numpy as np
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 8
+
+
+def grow_array(array, capacity, fill_value=None):
+    """Return copy of the array extended to the required capacity"""
+    import numpy as np
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    if fill_value is not None:
+        grown[len(array):] = fill_value
+    return grown
+
+
 class RarogException(Exception):
     pass
 
 
-class Manager(Client):
-    """Base logger that allows you to manipulate with experiments"""
+class BufferColumn:
+    """Growable array with values of one column and mask of filled rows
 
-    def __init__(self, host='localhost', *args, **kwargs):
-        super().__init__(host=host, *args, **kwargs)
+    Column is backed by typed numpy array while all values have the same scalar type,
+    otherwise it falls back to numpy array of objects. Column with reducer keeps
+    reducer state for every row and folds new values into it.
+    """
+
+    def __init__(self, capacity, reducer=None):
+        import numpy as np
+        self.values = None
+        self.present = np.zeros(capacity, dtype=bool)
+        self.__python_type = None
+        self.__reducer = reducer
+
+    def set(self, row, value):
+        if self.__reducer is not None:
+            if self.values is None:
+                import numpy as np
+                self.values = np.empty(len(self.present), dtype=object)
+            if not self.present[row]:
+                self.values[row] = self.__reducer()
+                self.present[row] = True
+            self.values[row].update(value)
+            return
+        if self.values is None:
+            import numpy as np
+            self.__python_type = type(value)
+            if isinstance(value, (bool, int, float, np.bool_, np.number)):
+                dtype = np.asarray(value).dtype
+            else:
+                dtype = object
+            self.values = np.empty(len(self.present), dtype=dtype)
+        elif type(value) is not self.__python_type and self.values.dtype != object:
+            self.values = self.values.astype(object)
+        self.values[row] = value
+        self.present[row] = True
+
+    def resize(self, capacity):
+        self.present = grow_array(self.present, capacity, fill_value=False)
+        if self.values is not None:
+            self.values = grow_array(self.values, capacity)
+
+    def keep(self, rows):
+        """Keep only values of the rows, they are moved to the beginning of the column"""
+        capacity = len(self.present)
+        self.present = grow_array(self.present[rows], capacity, fill_value=False)
+        if self.values is not None:
+            self.values = grow_array(self.values[rows], capacity)
+
+    def take(self, rows):
+        """Return list of values of the rows, results of reducers for reduced column"""
+        if self.__reducer is not None:
+            return [state.result() for state in self.values[rows]]
+        return self.values[rows].tolist()
+
+
+class ColumnarBuffer:
+    """Accumulate traced values column-wise, one row per (step, phase, rank) triple"""
+
+    def __init__(self, capacity=1024, reducers=None, metric_types=None):
+        """
+        Args:
+            capacity (int): initial number of rows
+            reducers (dict): mapping of metric names to reducer classes, values of such
+                metrics traced for the same row are folded instead of overwritten
+            metric_types (MetricTypes): cache to validate values against types of
+                previous values of the same metrics
+        """
+        self.__capacity = capacity
+        self.__reducers = reducers or {}
+        self.__metric_types = metric_types
+        self.clear()
+
+    def __len__(self):
+        return self.__size
+
+    @property
+    def nbytes(self):
+        """Approximate size of accumulated values"""
+        return self.__nbytes
+
+    def clear(self, held_step=None):
+        """Drop accumulated values
+
+        Args:
+            held_step (int): rows of this step are kept, see `batches`
+        """
+        if held_step is not None and self.__size:
+            import numpy as np
+            held = np.flatnonzero(self.__steps[:self.__size] == held_step)
+            if len(held):
+                self.__keep(held)
+                return
+        self.__size = 0
+        self.__nbytes = 0
+        self.__rows = {}
+        # arrays are allocated by the first append, so idle buffers cost nothing
+        self.__steps = self.__times = self.__phases = self.__ranks = None
+        self.__columns = {}
+
+    def __keep(self, rows):
+        """Keep only the rows, they are moved to the beginning of the buffer"""
+        keys = {row: key for key, row in self.__rows.items()}
+        self.__rows = {keys[row]: idx for idx, row in enumerate(rows.tolist())}
+        capacity = len(self.__steps)
+        self.__steps = grow_array(self.__steps[rows], capacity)
+        self.__times = grow_array(self.__times[rows], capacity)
+        self.__phases = grow_array(self.__phases[rows], capacity)
+        self.__ranks = grow_array(self.__ranks[rows], capacity)
+        self.__size = len(rows)
+        self.__nbytes = sum(8 + len(phase) for phase in self.__phases[:self.__size])
+        for name, column in self.__columns.items():
+            column.keep(rows)
+            if name not in self.__reducers:
+                self.__nbytes += sum(
+                    value_nbytes(value)
+                    for value in column.values[:self.__size][column.present[:self.__size]])
+
+    def __allocate(self):
+        import numpy as np
+        self.__steps = np.empty(self.__capacity, dtype=np.uint32)
+        self.__times = np.empty(self.__capacity, dtype=np.uint32)
+        self.__phases = np.empty(self.__capacity, dtype=object)
+        self.__ranks = np.empty(self.__capacity, dtype=np.int32)
+
+    def append(self, names_to_values, step, phase, timestamp, rank=None):
+        """Add values to the row of (step, phase, rank), previous values of the row
+        are updated
+
+        Args:
+            names_to_values (dict): metric name to value mapping
+            step (int): increment
+            phase (str): phase of the experiment
+            timestamp (int): unix time of the values
+            rank (int): rank of the process that traced values, if any
+
+        Raises:
+            NotImplementedError, RarogException: if some value can't be stored, nothing
+                is added then
+        """
+        # values are checked before the row is created, so a failed call leaves no row
+        if self.__metric_types is not None:
+            checked = [(name, self.__metric_types.check(name, value))
+                       for name, value in names_to_values.items()]
+        else:
+            checked = [(name, check_value(value)) for name, value in names_to_values.items()]
+        row = self.__rows.get((step, phase, rank))
+        if row is None:
+            row = self.__size
+            if self.__steps is None:
+                self.__allocate()
+            elif row == len(self.__steps):
+                self.__resize(2 * len(self.__steps))
+            self.__rows[(step, phase, rank)] = row
+            self.__steps[row] = step
+            self.__phases[row] = phase
+            self.__ranks[row] = -1 if rank is None else rank
+            self.__size += 1
+            self.__nbytes += 8 + len(phase)
+        self.__times[row] = timestamp
+        for name, value in checked:
+            column = self.__columns.get(name)
+            if column is None:
+                column = self.__columns[name] = BufferColumn(
+                    len(self.__steps), reducer=self.__reducers.get(name))
+            column.set(row, value)
+            if name not in self.__reducers:
+                self.__nbytes += value_nbytes(value)
+
+    def __resize(self, capacity):
+        self.__steps = grow_array(self.__steps, capacity)
+        self.__times = grow_array(self.__times, capacity)
+        self.__phases = grow_array(self.__phases, capacity)
+        self.__ranks = grow_array(self.__ranks, capacity)
+        for column in self.__columns.values():
+            column.resize(capacity)
+
+    def batches(self, held_step=None):
+        """Split accumulated rows into batches with the same set of filled columns
+
+        Args:
+            held_step (int): rows of this step are not included, e.g. because reducers
+                of the step may still receive values
+
+        Returns:
+            list(dict): mapping of column names to lists of values for every batch
+        """
+        import numpy as np
+        selected = np.arange(self.__size)
+        if held_step is not None:
+            selected = selected[self.__steps[:self.__size] != held_step]
+        if not len(selected):
+            return []
+        names = list(self.__columns)
+        # rank is the last column of the mask, it is filled only for rows with rank
+        presence = np.stack(
+            [self.__columns[name].present[selected] for name in names] +
+            [self.__ranks[selected] >= 0], axis=1)
+        patterns, inverse = np.unique(presence, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        batches = []
+        for pattern_idx, pattern in enumerate(patterns):
+            rows = selected[inverse == pattern_idx]
+            batch = {
+                name: self.__columns[name].take(rows)
+                for name, filled in zip(names, pattern) if filled
+            }
+            batch['step'] = self.__steps[rows].tolist()
+            batch['phase'] = self.__phases[rows].tolist()
+            batch['time'] = self.__times[rows].tolist()
+            if pattern[-1]:
+                batch['rank'] = self.__ranks[rows].tolist()
+            batches.append(batch)
+        return batches
+
+
+class Manager:
+    """Base logger that allows you to manipulate with experiments
+
+    Client of the database is created and connected on the first query, other methods
+    of the `clickhouse_driver.Client` are available on the manager too.
+    """
+
+    def __init__(self, host='localhost', *args, pool=None, **kwargs):
+        """
+        Args:
+            host (str): database host
+            pool (rarog.pool.ConnectionPool): if provided, queries are executed with
+                connections of the pool instead of the own connection
+            kwargs: other arguments of the `clickhouse_driver.Client`, e.g.
+                `compression='lz4'` or `compression='zstd'` to compress inserted and
+                selected blocks
+
+        Raises:
+            RarogException: if libraries required for compression are not installed
+        """
+        self.__client_args = (host,) + args
+        self.__client_kwargs = kwargs
+        self.__client = None
+        # keep connection parameters as keywords to open connections for trackers
+        if args:
+            import inspect
+            from clickhouse_driver.connection import Connection
+            self._connection_kwargs = {
+                **inspect.signature(Connection).bind_partial(host, *args).arguments, **kwargs}
+        else:
+            self._connection_kwargs = dict(kwargs, host=host)
+        # connection is not thread safe, so queries from different threads are serialized
+        self._execute_lock = threading.RLock()
+        self.pool = pool
+        self.__owns_pool = False
+        if kwargs.get('compression'):
+            # compression libraries are checked by the client, so it is created right away
+            self.client
+
+    @property
+    def client(self):
+        """Own `clickhouse_driver.Client`, created on the first use"""
+        with self._execute_lock:
+            if self.__client is None:
+                from clickhouse_driver import Client
+                try:
+                    self.__client = Client(*self.__client_args, **self.__client_kwargs)
+                except import_click_errors().UnknownCompressionMethod:
+                    raise RarogException(
+                        'Compression `{compression}` requires `pip install '
+                        'rarog[{compression}]`'.format(
+                            compression=self.__client_kwargs['compression']))
+            return self.__client
+
+    def __getattr__(self, name):
+        # private attributes are never passed, so missed ones don't create the client
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def execute(self, *args, **kwargs):
+        if self.pool is not None:
+            return self.pool.execute(*args, **kwargs)
+        with self._execute_lock:
+            return self.client.execute(*args, **kwargs)
+
+    def execute_iter(self, *args, **kwargs):
+        if self.pool is not None:
+            return self.pool.execute_iter(*args, **kwargs)
+        return self.__execute_iter_locked(*args, **kwargs)
+
+    def __execute_iter_locked(self, *args, **kwargs):
+        # connection is busy until all rows are received
+        with self._execute_lock:
+            try:
+                yield from self.client.execute_iter(*args, **kwargs)
+            except BaseException:
+                # iteration was abandoned or failed, rest of the result can't be skipped
+                self.client.disconnect()
+                raise
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Borrow client of the pool or the own client for the duration of the block,
+        e.g. for streaming methods of the client
+        """
+        if self.pool is not None:
+            with self.pool.connection() as client:
+                yield client
+        else:
+            with self._execute_lock:
+                yield self.client
+
+    @contextlib.contextmanager
+    def _stream_pool(self):
+        """Return pool for long streaming queries for the duration of the block: pool of
+        the manager, or a pool of one connection that is closed after the block, so
+        streams don't hold the own connection
+        """
+        if self.pool is not None:
+            yield self.pool
+            return
+        from .pool import ConnectionPool
+        pool = ConnectionPool(size=1, **self._connection_kwargs)
+        try:
+            yield pool
+        finally:
+            pool.disconnect()
+
+    def disconnect(self):
+        """Close own connection and connections of the pool created by the manager"""
+        if self.__client is not None:
+            self.__client.disconnect()
+        if self.__owns_pool:
+            self.pool.disconnect()
+
+    def _table_key(self, name):
+        """Return key of the table in `CREATED_TABLES`"""
+        return (self._connection_kwargs.get('host'), self._connection_kwargs.get('port'),
+                self._connection_kwargs.get('database'), name)
+
+    def tracker(self, name, **kwargs):
+        """Create tracker that shares connection pool with the manager and other
+        trackers created by it, so the number of connections doesn't grow with the
+        number of experiments
+
+        Args:
+            name (str): name of experiment to be logged
+            kwargs: other arguments of the `Tracker`
+        """
+        return Tracker(name, pool=self._shared_pool(), **self._connection_kwargs, **kwargs)
+
+    def _shared_pool(self):
+        """Return pool of the manager, create it with manager connection parameters
+        if required
+        """
+        if self.pool is None:
+            from .pool import ConnectionPool
+            self.pool = ConnectionPool(**self._connection_kwargs)
+            self.__owns_pool = True
+        return self.pool
 
     def list_experiments(self):
         """Show available experiments"""
-        return [table[0] for table in self.execute('SHOW TABLES')]
+        return [table[0] for table in self.execute('SHOW TABLES')
+                if ROLLUP_SEPARATOR not in table[0]]
 
     def remove_experiment(self, name):
         """Remove experiment by name
@@ -92,19 +805,261 @@ class Manager(Client):
         Raises:
             RarogException: if experiment was not found in database
         """
+        CREATED_TABLES.discard(self._table_key(name))
         try:
             self.execute('DROP TABLE {table_name}'.format(table_name=name))
-        except click_errors.ServerException as e:
+        except import_click_errors().ServerException as e:
             if "doesn't exist.." in e.message:
                 raise RarogException("Experiment `{name}` doesn't exist already".format(
                     name=name))
+        # materialized views go before their target tables
+        rollups = sorted(
+            (table[0] for table in self.execute('SHOW TABLES')
+             if table[0].startswith(name + ROLLUP_SEPARATOR)),
+            key=lambda table_name: not table_name.endswith('_mv'))
+        for table_name in rollups:
+            self.execute('DROP TABLE IF EXISTS {table_name}'.format(table_name=table_name))
+
+    def export_experiment(self, name, path, block_rows=65536):
+        """Stream rows of the experiment to the Parquet file, requires pyarrow
+
+        Args:
+            name (str): name of the experiment
+            path (str): path to the created file
+            block_rows (int): number of rows in a block of the stream and a row group
+
+        Returns:
+            int: number of exported rows
+        """
+        from .archive import export_experiment
+        return export_experiment(self, name, path, block_rows=block_rows)
+
+    def import_experiment(self, path, name=None, block_rows=65536, exist_ok=False):
+        """Create experiment from the Parquet file made by `export_experiment`,
+        requires pyarrow
+
+        Args:
+            path (str): path to the exported file
+            name (str): name of the experiment, exported name by default
+            block_rows (int): number of rows inserted with one query
+            exist_ok (bool): if `False` raises an exception if the experiment already exists
+
+        Returns:
+            int: number of imported rows
+
+        Raises:
+            RarogException: if file was not created by export or experiment already exists
+        """
+        from .archive import import_experiment
+        return import_experiment(self, path, name=name, block_rows=block_rows,
+                                 exist_ok=exist_ok)
+
+    def follow(self, name, metrics, **kwargs):
+        """Yield values of metrics of the experiment as they are written to the database
+
+        Args:
+            name (str): name of the experiment
+            metrics (str or list(str)): names of metrics
+            kwargs: other arguments of `Tracker.follow`
+
+        Raises:
+            RarogException: if experiment or some metric doesn't exist
+        """
+        tracker = self._open_experiment(name)
+        try:
+            yield from tracker.follow(metrics, **kwargs)
+        finally:
+            tracker.close()
+
+    def compare(self, experiments, metric, phase=None, agg='avg', step_buckets=None,
+                summary='last'):
+        """Compare numeric metric across experiments with a single query
+
+        Values of all experiments are read by one UNION ALL query, which aggregates them
+        over step buckets on the server, so the number of round trips doesn't depend on
+        the number of experiments. Experiments with wide and narrow storage may be mixed.
+
+        Args:
+            experiments (list(str) or str): names of experiments or regular expression
+                matched against names of all experiments
+            metric (str): name of the numeric metric
+            phase (str): phase of the experiments, all phases by default
+            agg (str): aggregation of values over a bucket, one of `avg`, `min`, `max`
+                and `sum`
+            step_buckets (int): number of equal buckets of steps from zero to the last
+                step of all experiments, every step is a bucket by default
+            summary (str): value of the summary of every experiment: `last` is the value
+                of the last step, `min` and `max` are the best values
+
+        Returns:
+            dict: `experiment` - names of experiments, `step` - first steps of buckets,
+                `values` - matrix of experiments by buckets with `nan` for buckets without
+                values, `summary` - summary of every experiment
+
+        Raises:
+            RarogException: if some experiment doesn't exist or has no such numeric
+                metric, aggregation or summary is not supported
+        """
+        import numpy as np
+        if agg not in ('avg', 'min', 'max', 'sum'):
+            raise RarogException('Aggregation `{agg}` is not supported'.format(agg=agg))
+        if summary not in ('last', 'min', 'max'):
+            raise RarogException('Summary `{summary}` is not supported'.format(summary=summary))
+        params = {'metric': metric, 'phase': phase}
+        names, runs, max_steps = [], [], []
+        for name, engine, columns_types in self.__compared_tables(experiments, metric):
+            conditions = ['phase = %(phase)s'] if phase is not None else []
+            if set(NARROW_COLUMNS) <= set(columns_types):
+                conditions.append('metric = %(metric)s')
+                value = "if(startsWith(type, 'Float'), value_float, toFloat64(value_int))"
+            elif is_numeric_click_type(strip_nullable(columns_types.get(metric, ''))):
+                # rows without the metric are NULL in wide tables
+                conditions.append('isNotNull({metric})'.format(metric=metric))
+                value = 'assumeNotNull(toFloat64({metric}))'.format(metric=metric)
+            else:
+                raise RarogException(
+                    'Numeric metric `{metric}` does not exist in `{name}`'.format(
+                        metric=metric, name=name))
+            runs.append(
+                'SELECT toUInt32({idx}) AS run, step, {value} AS value '
+                'FROM {name}{final} {where}'.format(
+                    idx=len(names), value=value, name=name, where=where_clause(conditions),
+                    final=' FINAL' if engine == 'ReplacingMergeTree' else ''))
+            # replaced rows don't change the last step, so it is read without FINAL
+            max_steps.append('(SELECT max(step) FROM {name} {where})'.format(
+                name=name, where=where_clause(conditions)))
+            names.append(name)
+        runs = ' UNION ALL '.join(runs)
+        if step_buckets:
+            # last step is read from the step column of every table, not from the union
+            with_clause = 'WITH arrayMax([{max_steps}]) AS max_step, ' \
+                'intDiv(max_step, {buckets}) + 1 AS bucket_size'.format(
+                    max_steps=', '.join(max_steps), buckets=step_buckets)
+            bucket = 'intDiv(step, bucket_size) * bucket_size'
+        else:
+            with_clause, bucket = '', 'step'
+        rows = self.execute(
+            '''{with_clause}
+            SELECT run, {bucket} AS bucket, {agg}(value), argMax(value, step), min(value),
+                max(value)
+            FROM ({runs})
+            GROUP BY run, bucket
+            ORDER BY run, bucket
+            '''.format(with_clause=with_clause, bucket=bucket, agg=agg, runs=runs), params)
+        steps = sorted({row[1] for row in rows})
+        columns = {step: idx for idx, step in enumerate(steps)}
+        values = np.full((len(names), len(steps)), np.nan)
+        summaries = np.full(len(names), np.nan)
+        for run, step, value, last_value, min_value, max_value in rows:
+            values[run, columns[step]] = value
+            if summary == 'last':
+                # rows of the run are ordered by bucket, so the last one wins
+                summaries[run] = last_value
+            elif summary == 'min':
+                summaries[run] = np.fmin(summaries[run], min_value)
+            else:
+                summaries[run] = np.fmax(summaries[run], max_value)
+        return {'experiment': np.asarray(names, dtype=object),
+                'step': np.asarray(steps, dtype=np.uint32), 'values': values,
+                'summary': summaries}
+
+    def __compared_tables(self, experiments, metric):
+        """Return name, engine and types of columns that store the metric for every
+        compared experiment
+
+        Raises:
+            RarogException: if some experiment doesn't exist or nothing is selected
+        """
+        if not experiments:
+            raise RarogException('No experiments to compare')
+        params = {'columns': NARROW_COLUMNS + (metric,)}
+        if isinstance(experiments, str):
+            table_condition = 'match(c.table, %(pattern)s)'
+            params['pattern'] = experiments
+        else:
+            table_condition = 'c.table IN %(names)s'
+            params['names'] = tuple(experiments)
+        rows = self.execute(
+            '''SELECT c.table, t.engine, c.name, c.type
+            FROM system.columns AS c
+            INNER JOIN system.tables AS t ON c.database = t.database AND c.table = t.name
+            WHERE c.database = currentDatabase() AND {table_condition}
+                AND c.name IN %(columns)s
+            '''.format(table_condition=table_condition), params)
+        tables = {}
+        for name, engine, column, data_type in rows:
+            # rollup tables of experiments are not experiments themselves
+            if ROLLUP_SEPARATOR not in name:
+                tables.setdefault(name, (engine, {}))[1][column] = data_type
+        if isinstance(experiments, str):
+            experiments = sorted(tables)
+        if not experiments:
+            raise RarogException('No experiments to compare')
+        for name in experiments:
+            if name not in tables:
+                raise RarogException("Experiment `{name}` doesn't exist".format(name=name))
+        return [(name,) + tables[name] for name in experiments]
+
+    def _open_experiment(self, name):
+        """Return tracker of existing experiment with storage and layout of its table
+
+        Raises:
+            RarogException: if experiment doesn't exist
+        """
+        engines = self.execute(
+            'SELECT engine FROM system.tables WHERE database = currentDatabase() '
+            'AND name = %(name)s', {'name': name})
+        if not engines:
+            raise RarogException("Experiment `{name}` doesn't exist".format(name=name))
+        columns = {col[0] for col in self.execute('DESCRIBE TABLE {name}'.format(name=name))}
+        # the tracker only reads, batching just satisfies the check of replacing layouts
+        return Tracker(
+            name, sync_step=1, exist_ok=True, pool=self._shared_pool(),
+            storage='narrow' if set(NARROW_COLUMNS) <= columns else 'wide',
+            layout='replacing' if engines[0][0] == 'ReplacingMergeTree' else 'summing',
+            **self._connection_kwargs)
+
+    def replay_log(self, path, name=None, remove=False):
+        """Write records of the local log that are not in the database yet, the table
+        is created with storage and layout of the tracker that wrote the log
+
+        Args:
+            path (str): path to the log written by tracker with `wal_path`
+            name (str): name of experiment, name from the log header by default
+            remove (bool): remove log after all records were written
+
+        Raises:
+            RarogException: if records were not written because the database is not
+                available, the log is kept then
+        """
+        from .wal import read_header
+        header = read_header(path)
+        if name is None:
+            name = header['table']
+        # records are written with one flush, batching just satisfies the check of
+        # replacing layouts
+        with Tracker(name, exist_ok=True, wal_path=path, sync_step=1, pool=self.pool,
+                     **header.get('options', {}), **self._connection_kwargs) as tracker:
+            tracker.flush()
+            if tracker.stats()['connection_errors']:
+                raise RarogException(
+                    'Records of `{path}` were not written, the database is not '
+                    'available'.format(path=path))
+        if remove:
+            os.remove(path)
+            if os.path.exists(path + '.offset'):
+                os.remove(path + '.offset')
 
 
 class Tracker(Manager):
     """Track metrics from your experiment"""
 
     def __init__(self, name, sync_step=0, sync_seconds=0, host='localhost', exist_ok=False,
-                 *args, **kwargs):
+                 async_flush=False, queue_size=10000, max_buffer_rows=0, max_buffer_bytes=0,
+                 spill_dir=None, wal_path=None, offline=False, ranked=False, rollups=(),
+                 reducers=None, on_flush=None, on_schema_change=None, codecs=False,
+                 storage='wide', layout='summing', ttl_days=None, sample=False, lazy=False,
+                 samplers=None, *args, **kwargs):
         """Initialize connection and create table for experiment
 
         Args:
@@ -113,35 +1068,290 @@ class Tracker(Manager):
             sync_seconds (int): time frequency for dumping results into database
             exist_ok (bool): if exist_ok if `False`(default) raises an exception if an
                 experiment with the same name already exists
+            async_flush (bool): if `True` traced values are only enqueued and written
+                to the database by a background thread
+            queue_size (int): maximum number of traces waiting for the background
+                thread, `trace` blocks when the queue is full
+            max_buffer_rows (int): maximum number of accumulated rows, when it is reached
+                values are synced before `sync_step` or `sync_seconds`
+            max_buffer_bytes (int): approximate maximum size of accumulated values
+            spill_dir (str): directory for segment files. If provided, values that
+                failed to be written because of connection errors, or exceeded buffer
+                limits while a flush is running, are dumped to the disk and written to
+                the database on the next sync
+            wal_path (str): path to the local log. If provided, every traced value is
+                appended to the log first, and records of the log are written to the
+                database in batches with `sync_step` or `sync_seconds` frequency. Records
+                that failed to be written because of connection errors stay in the log,
+                and the table is created on the first write if the database was not
+                available on the construction
+            offline (bool): never connect to the database and only append values to
+                the local log, it can be written later with `Manager.replay_log`
+            ranked (bool): create table with `rank` column, so values traced by
+                different processes with the same step and phase are stored separately
+            rollups (tuple(int)): sizes of step buckets, for every size a rollup table
+                with min, max, sum and count of numeric metrics per phase and bucket is
+                filled by a materialized view. `read` with `max_points` uses the
+                coarsest suitable rollup instead of the experiment table. Views count
+                every inserted row, so rollups are not supported by replacing layouts
+            reducers (dict): mapping of metric names to reducers names (`mean`, `sum`,
+                `min`, `max`, `last`, `count`, `var`, `std`) or `rarog.reducers.Reducer`
+                subclasses. Values of such metrics traced several times for the same step
+                and phase are folded by the reducer, and only the result is written. Syncs
+                by time or buffer limits keep values of the step being traced, so steps
+                are expected to increase
+            on_flush (callable): called after every write of accumulated values with
+                a dict of `rows`, `bytes`, `inserts`, `seconds` and `error` of the write
+            on_schema_change (callable): called after columns were added to the table
+                with a mapping of the added columns names to their types
+            codecs (bool): create table and metrics columns with compression codecs:
+                DoubleDelta for `step` and `time`, LowCardinality for `phase`, Gorilla
+                for float metrics and ZSTD for arrays. Requires ClickHouse 19.11 or later
+            storage (str): layout of the experiment table. `wide`(default) keeps every
+                metric in its own column that is added on the first value of the metric,
+                numeric columns are nullable, so aggregations skip rows without the metric.
+                `narrow` keeps one row per metric value with the name of the metric and
+                typed value columns, ordered by metric, so it never changes the schema
+                and reads of a single metric scan only its rows. Narrow storage supports
+                numbers, strings and 1d numeric arrays and doesn't support rollups
+            layout (str): preset of the table engine, partitioning and ordering:
+
+                - `summing`(default) - SummingMergeTree with daily partitions ordered by
+                  step and phase. Rows of the same step and phase are summed on merges,
+                  so values traced separately are joined into one row, but a value traced
+                  twice for the same step is summed too. Long experiments produce many
+                  small partitions.
+                - `replacing` - ReplacingMergeTree with monthly partitions ordered by phase
+                  and step, the last inserted row of the same step and phase replaces
+                  previous ones, so re-logged values are overwritten. `read` uses FINAL,
+                  which is slower for large tables. With wide storage metrics of a step
+                  should be traced within one sync, otherwise only the last row is kept,
+                  so `sync_step` or `sync_seconds` is required. Narrow storage replaces
+                  every metric separately and works without batching.
+                - `replacing_unpartitioned` - the same without partitioning, the fewest
+                  parts for short experiments, but old data can't be dropped by partitions.
+                - `memory` - Memory engine for scratch runs, the fastest inserts and
+                  queries, values are lost on the server restart.
+                - `log` - Log engine for small scratch runs, no merges and indexes, every
+                  query reads the whole table.
+            ttl_days (int): remove values older than this number of days, only for merge
+                tree layouts
+            sample (bool): add sampling key by hash of the step, so queries may read a
+                fraction of steps with SAMPLE clause, only for merge tree layouts
+            lazy (bool): connect and create the table on the first write or read instead
+                of the construction, so short jobs that never log don't wait for the
+                database. Errors of the creation, e.g. already existing experiment,
+                are raised by that call. Table is created or checked only once per
+                process, later trackers with `exist_ok=True` skip the round trip
+            samplers (dict): mapping of metric names to `rarog.samplers.Sampler`
+                instances, e.g. `EveryNth(100)`, `MaxRate(10)`, `Reservoir(10, 1000)` or
+                `KeepExtremes(EveryNth(100), 1000)`. Values of such metrics are filtered
+                before they are buffered, a copy of the sampler is kept for every phase.
+                Values held for the last windows are written on `close`, not on `flush`,
+                so windows are not cut by flushes. Held values are written as separate
+                rows of their steps, so replacing layouts with wide storage don't accept
+                samplers that hold values, e.g. `Reservoir` or `KeepExtremes`
 
         Raises:
-            RarogException: if experiment already exists
+            RarogException: if experiment already exists, offline tracker has no local log,
+                reducer, sampler, storage or layout is unknown, replacing layout is used
+                with wide storage without batching or samplers that hold values, or with
+                rollups
         """
+        if offline and wal_path is None:
+            raise RarogException('Offline tracker requires `wal_path`')
+        if storage not in ('wide', 'narrow'):
+            raise RarogException('Storage `{storage}` is not supported'.format(storage=storage))
+        if storage == 'narrow' and rollups:
+            raise RarogException('Rollups are not supported by narrow storage')
+        if layout not in TABLE_LAYOUTS:
+            raise RarogException('Layout `{layout}` is not supported'.format(layout=layout))
+        if rollups and TABLE_LAYOUTS[layout]['final']:
+            # views see every inserted row, including rows that are replaced later
+            raise RarogException('Rollups are not supported by `{layout}` layout'.format(
+                layout=layout))
+        if (ttl_days or sample) and TABLE_LAYOUTS[layout]['order_by'] is None:
+            raise RarogException('TTL and sampling are not supported by `{layout}` layout'.format(
+                layout=layout))
+        if TABLE_LAYOUTS[layout]['final'] and storage == 'wide' and \
+                not (sync_step or sync_seconds):
+            raise RarogException(
+                '`{layout}` layout with wide storage keeps only the last row of a step, '
+                'set `sync_step` or `sync_seconds` or use narrow storage'.format(layout=layout))
+        self.__reducers = {}
+        for metric, reducer in (reducers or {}).items():
+            if isinstance(reducer, str):
+                if reducer not in REDUCERS:
+                    raise RarogException('Reducer `{reducer}` is not supported'.format(
+                        reducer=reducer))
+                reducer = REDUCERS[reducer]
+            self.__reducers[metric] = reducer
+        self.__samplers = dict(samplers or {})
+        for metric, sampler in self.__samplers.items():
+            if not isinstance(sampler, Sampler):
+                raise RarogException('Sampler of `{metric}` should be a `Sampler`'.format(
+                    metric=metric))
+            if sampler.holds_values and TABLE_LAYOUTS[layout]['final'] and storage == 'wide':
+                # held value is written later in its own row, that replaces the flushed row
+                # of the step with values of other metrics
+                raise RarogException(
+                    'Sampler of `{metric}` holds values, it is not supported by `{layout}` '
+                    'layout with wide storage, use narrow storage'.format(
+                        metric=metric, layout=layout))
+        # copies of samplers for every metric, phase and rank
+        self.__phase_samplers = {}
         super().__init__(host=host, *args, **kwargs)
         self.table = name
-        if sync_step or sync_seconds:
+        self.__columns_types = None
+        self.__metric_types = MetricTypes()
+        self.__codecs = codecs
+        self.__narrow = storage == 'narrow'
+        self.__layout = TABLE_LAYOUTS[layout]
+        self.__ttl_days = ttl_days
+        self.__sample = sample
+        self.__rollups = tuple(sorted(rollups))
+        self.__batching = bool(sync_step or sync_seconds)
+        # arrays traced by the caller are kept after the call by the queue, the buffer
+        # or reducers, so they are copied
+        self.__copies_arrays = async_flush or (
+            wal_path is None and (self.__batching or bool(self.__reducers)))
+        self.__sync_step = sync_step
+        self.__sync_seconds = sync_seconds
+        self.__last_steps_sync = 0
+        self.__last_time_sync = time()
+        self.__wal = None
+        self.__offline = offline
+        self.__wal_retry_time = 0
+        self.__on_flush = on_flush
+        self.__on_schema_change = on_schema_change
+        self.__stats = dict.fromkeys(
+            ('flushes', 'flush_seconds', 'last_flush_seconds', 'inserts', 'rows_sent',
+             'bytes_sent', 'schema_changes', 'schema_retries', 'connection_errors',
+             'spilled_segments', 'sampled_out'), 0)
+        if wal_path is not None:
+            from .wal import WriteAheadLog
+            # options of the table are kept in the log, so it is replayed to the same table
+            self.__wal = WriteAheadLog(wal_path, table=self.table, options={
+                'storage': storage, 'layout': layout, 'ranked': ranked, 'codecs': codecs,
+                'ttl_days': ttl_days, 'sample': sample, 'rollups': self.__rollups})
+            self.__trace_method = self.__wal_tracing
+            self.__multy_trace_method = self.__wal_tracing_multy
+        elif self.__batching:
             self.__trace_method = self.__batch_tracing
             self.__multy_trace_method = self.__batch_tracing_multy
-            self.__upload_values = {}
-            self.__sync_step = sync_step
-            self.__sync_seconds = sync_seconds
-            self.__last_steps_sync = 0
-            self.__last_time_sync = time()
+            self.__upload_values = ColumnarBuffer(
+                reducers=self.__reducers, metric_types=self.__metric_types)
+            self.__max_buffer_rows = max_buffer_rows
+            self.__max_buffer_bytes = max_buffer_bytes
+            self.__spill_dir = spill_dir
+            self.__spilled_segments = []
+            self.__spill_counter = 0
         else:
             self.__trace_method = self.__non_batch_tracing
             self.__multy_trace_method = self.__non_batch_tracing_multy
+            # values of reduced metrics are kept until the next step
+            self.__reduced_values = ColumnarBuffer(
+                reducers=self.__reducers, metric_types=self.__metric_types)
+            self.__reduced_step = None
+        self.__exist_ok = exist_ok
+        self.__ranked = ranked
+        # offline tracker never creates the table
+        self.__table_ready = offline
+        if not lazy:
+            if self.__wal is not None:
+                # values are kept in the log, so the tracker starts while the database is down
+                self.__keep_log_on_connection_error(self.__prepare_table)
+            else:
+                self.__prepare_table()
+        self.__queue = None
+        self.__writer_error = None
+        self.__closed = False
+        self.__flushing = False
+        if async_flush:
+            self.__queue = queue.Queue(maxsize=queue_size)
+            self.__writer = threading.Thread(
+                target=self.__drain_queue, name='rarog-{}'.format(self.table), daemon=True)
+            self.__writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return '{class_name}:{table_name}'.format(
+            class_name=self.__class__.__name__, table_name=self.table)
+
+    def __prepare_table(self):
+        """Create table and rollups of the experiment if it wasn't done yet"""
+        if self.__table_ready:
+            return
+        key = self._table_key(self.table)
+        if not (self.__exist_ok and key in CREATED_TABLES):
+            self.__create_table(self.__exist_ok, self.__ranked)
+            CREATED_TABLES.add(key)
+        # rollups read the schema of the table, which prepares it again
+        self.__table_ready = True
+        if self.__rollups:
+            self.__create_rollups()
+
+    def __create_table(self, exist_ok, ranked):
+        """Create table for the experiment
+
+        Args:
+            exist_ok (bool): if `False` raises an exception if table already exists
+            ranked (bool): add `rank` column to the table and its ordering key
+
+        Raises:
+            RarogException: if experiment already exists
+        """
+        if self.__codecs:
+            columns = '''time DateTime DEFAULT now() CODEC(DoubleDelta, LZ4),
+                    step UInt32 CODEC(DoubleDelta, LZ4),
+                    phase LowCardinality(String)'''
+        else:
+            columns = '''time DateTime DEFAULT now(),
+                    step UInt32,
+                    phase String'''
+        layout = self.__layout
+        order_by = layout['order_by']
+        if self.__narrow:
+            columns += ''',
+                    metric LowCardinality(String),
+                    type LowCardinality(String),
+                    value_float Float64{float_codec},
+                    value_int Int64,
+                    value_string String,
+                    value_array Array(Float64){array_codec}'''.format(
+                float_codec=click_column_codec('Float64') if self.__codecs else '',
+                array_codec=click_column_codec('Array(Float64)') if self.__codecs else '')
+            if order_by is not None:
+                order_by = ('metric', 'phase', 'step')
+        settings = ''
+        if order_by is not None:
+            order_by += ('rank',) if ranked else ()
+            if self.__sample:
+                # sampling expression should be a part of the primary key
+                order_by += ('intHash32(step)',)
+            settings = 'ORDER BY ({order_by})'.format(order_by=', '.join(order_by))
+            if layout['partition_by'] is not None:
+                settings = 'PARTITION BY {partition_by} {settings}'.format(
+                    partition_by=layout['partition_by'], settings=settings)
+            if self.__sample:
+                settings += ' SAMPLE BY intHash32(step)'
+            if self.__ttl_days:
+                settings += ' TTL time + INTERVAL {days} DAY'.format(days=self.__ttl_days)
         try:
             self.execute(
                 '''CREATE TABLE {table_name} (
-                    time DateTime DEFAULT now(),
-                    step UInt32,
-                    phase String
-                ) ENGINE = SummingMergeTree()
-                PARTITION BY toYYYYMMDD(time)
-                ORDER BY (step, phase)
-                '''.format(table_name=self.table)
+                    {columns}{rank_column}
+                ) ENGINE = {engine}
+                {settings}
+                '''.format(table_name=self.table, columns=columns, engine=layout['engine'],
+                           settings=settings, rank_column=', rank UInt16' if ranked else '')
             )
-        except click_errors.ServerException as e:
+        except import_click_errors().ServerException as e:
             if 'already exists..' in e.message:
                 if not exist_ok:
                     raise RarogException(
@@ -149,16 +1359,396 @@ class Tracker(Manager):
             else:
                 raise e
 
-    def __repr__(self):
-        return '{class_name}:{table_name}'.format(
-            class_name=self.__class__.__name__, table_name=self.table)
+    def __create_rollups(self):
+        """Create rollup tables and materialized views that fill them"""
+        for size in self.__rollups:
+            self.execute(
+                '''CREATE TABLE IF NOT EXISTS {rollup_name} (
+                    phase String,
+                    bucket UInt32,
+                    row_count SimpleAggregateFunction(sum, UInt64)
+                ) ENGINE = AggregatingMergeTree()
+                ORDER BY (phase, bucket)
+                '''.format(rollup_name=self.__rollup_name(size)))
+        self.__update_rollups()
+
+    def __rollup_name(self, size):
+        return '{table_name}{separator}{size}'.format(
+            table_name=self.table, separator=ROLLUP_SEPARATOR, size=size)
+
+    def __update_rollups(self):
+        """Add numeric metrics of the experiment to rollup tables and materialized
+        views that fill them
+        """
+        metrics = [
+            name for name, data_type in self.__get_columns_types().items()
+            if name not in SERVICE_COLUMNS and is_numeric_click_type(data_type)]
+        for size in self.__rollups:
+            rollup_name = self.__rollup_name(size)
+            if metrics:
+                # aggregates of buckets without the metric are NULL, and the number of
+                # its values is kept separately from the number of rows
+                self.execute('ALTER TABLE {rollup_name} {add_columns}'.format(
+                    rollup_name=rollup_name,
+                    add_columns=', '.join(
+                        'ADD COLUMN IF NOT EXISTS {metric}__{func} {data_type}'.format(
+                            metric=metric, func=func,
+                            data_type='SimpleAggregateFunction(sum, UInt64)'
+                            if func == 'count' else
+                            'SimpleAggregateFunction({func}, Nullable(Float64))'.format(
+                                func=func))
+                        for metric in metrics for func in ROLLUP_FUNCTIONS)))
+            query = '''SELECT phase, intDiv(step, {size}) * {size} AS bucket,
+                    count() AS row_count{columns}
+                FROM {table_name}
+                GROUP BY phase, bucket'''.format(
+                size=size, table_name=self.table,
+                columns=''.join(
+                    ', {func}({value}) AS {metric}__{func}'.format(
+                        metric=metric, func=func,
+                        value=metric if func == 'count' else 'toFloat64({metric})'.format(
+                            metric=metric))
+                    for metric in metrics for func in ROLLUP_FUNCTIONS))
+            if self.execute('EXISTS TABLE {rollup_name}_mv'.format(
+                    rollup_name=rollup_name))[0][0]:
+                # query is replaced in place, so no insert is missed by the view
+                self.execute(
+                    'ALTER TABLE {rollup_name}_mv MODIFY QUERY {query}'.format(
+                        rollup_name=rollup_name, query=query),
+                    settings={'allow_experimental_alter_materialized_view_structure': 1})
+            else:
+                self.execute(
+                    'CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup_name}_mv TO {rollup_name} '
+                    'AS {query}'.format(rollup_name=rollup_name, query=query))
 
     @property
     def metrics(self):
         """Return existing metrics in the experiment"""
-        return [col[0] for col in self.execute('DESCRIBE TABLE {name}'.format(name=self.table))]
+        return list(self.__load_columns_types())
+
+    def read(self, metrics, phase=None, step_range=None, max_points=None, aggregate='avg'):
+        """Read values of metrics from the database
+
+        Args:
+            metrics (str or list(str)): names of metrics
+            phase (str): phase of the experiment, all phases by default
+            step_range (tuple(int, int)): first and last steps to read, inclusive
+            max_points (int): maximum number of returned steps per phase. If provided,
+                the database aggregates values over step buckets, non-numeric metrics
+                get any value of the bucket
+            aggregate (str): aggregation of numeric metrics over a bucket, one of
+                `avg`, `min`, `max` and `sum`. Rollup buckets are used as a whole, so
+                with `step_range` the first and the last buckets may include more steps
+
+        Returns:
+            dict: mapping of `step`, `phase` and metrics names to numpy arrays ordered
+                by step and phase. Only rows with values of a single numeric metric are
+                read, when several metrics are read numeric ones are float arrays with
+                `nan` for rows and buckets without their values. With `max_points` step is
+                the first step of a bucket, the first bucket starts from the first read
+                step. Without `max_points` arrays with several dimensions are reshaped back
+
+        Raises:
+            RarogException: if some metric doesn't exist in the experiment or
+                aggregation is not supported
+        """
+        import numpy as np
+        if isinstance(metrics, str):
+            metrics = [metrics]
+        if aggregate not in ('avg', 'min', 'max', 'sum'):
+            raise RarogException('Aggregation `{aggregate}` is not supported'.format(
+                aggregate=aggregate))
+        columns_types, conditions, params = self.__read_conditions(metrics, phase)
+        shaped, shapes = [], []
+        if not max_points:
+            # arrays with several dimensions are read together with their shapes
+            shaped = [metric for metric in metrics if metric + SHAPE_SUFFIX in columns_types]
+            shapes = [metric + SHAPE_SUFFIX for metric in shaped
+                      if metric + SHAPE_SUFFIX not in metrics]
+            if shapes:
+                metrics = list(metrics) + shapes
+                columns_types, conditions, params = self.__read_conditions(metrics, phase)
+        if step_range is not None:
+            params['first_step'], params['last_step'] = step_range
+        # conditions of the rollup table are built separately
+        filled_conditions = self.__filled_conditions(metrics, columns_types)
+        if not max_points:
+            if step_range is not None:
+                conditions.append('step BETWEEN %(first_step)s AND %(last_step)s')
+            query = self.__values_query(
+                metrics, columns_types, conditions + filled_conditions)
+        else:
+            first_step, last_step = self.__step_bounds(
+                conditions + filled_conditions, params, step_range)
+            bucket_size = max(1, math.ceil((last_step - first_step + 1) / max_points))
+            rollup_size = None
+            if all(is_numeric_click_type(columns_types[metric]) for metric in metrics):
+                rollup_size = next(
+                    (size for size in reversed(self.__rollups) if size <= bucket_size), None)
+            if rollup_size is not None:
+                # bucket should consist of whole buckets of the rollup
+                first_step -= first_step % rollup_size
+                bucket_size = math.ceil(
+                    (last_step - first_step + 1) / (max_points * rollup_size)) * rollup_size
+                query = self.__rollup_query(
+                    metrics, aggregate, conditions, step_range, first_step, bucket_size,
+                    rollup_size)
+            else:
+                conditions.extend(filled_conditions)
+                if step_range is not None:
+                    conditions.append('step BETWEEN %(first_step)s AND %(last_step)s')
+                columns = [
+                    self.__metric_column(
+                        idx, metric, columns_types[metric],
+                        func=aggregate if is_numeric_click_type(columns_types[metric])
+                        else 'any', nan_missing=len(metrics) > 1)
+                    for idx, metric in enumerate(metrics)]
+                query = \
+                    '''SELECT intDiv(step - {first}, {size}) * {size} + {first} AS bucket_start,
+                        phase, {columns}
+                    FROM {table_name} {where}
+                    GROUP BY bucket_start, phase
+                    ORDER BY bucket_start, phase
+                    '''.format(first=first_step, size=bucket_size, columns=', '.join(columns),
+                               table_name=self.__read_table(), where=where_clause(conditions))
+        result = self.execute(query, params, columnar=True, with_column_types=True)
+        values = self.__columnar_result_to_numpy(result, ['step', 'phase'] + list(metrics))
+        for metric in shaped:
+            arrays = np.empty(len(values[metric]), dtype=object)
+            for idx, shape in enumerate(values[metric + SHAPE_SUFFIX]):
+                arrays[idx] = np.reshape(values[metric][idx], shape)
+            values[metric] = arrays
+        for shape_column in shapes:
+            del values[shape_column]
+        return values
+
+    def follow(self, metrics, phase=None, since_step=None, poll_interval=1.0,
+               chunk_size=10000):
+        """Yield values of metrics as they are written to the database
+
+        Generator keeps cursor of the greatest step of yielded rows, and every poll
+        streams by blocks only rows with not smaller step, so parts and granules of
+        older steps are skipped by the ordering key. Rows of the cursor step are read
+        again and rows that were already yielded are skipped. Rows written later with
+        steps smaller than the cursor, e.g. of a lagging phase, are not yielded, such
+        phases may be followed separately. Rows are streamed with a connection of
+        the pool, or a separate connection when the tracker has no pool, so the
+        tracker may be used between chunks.
+
+        Args:
+            metrics (str or list(str)): names of metrics
+            phase (str): phase of the experiment, all phases by default
+            since_step (int): first step to yield, all steps by default
+            poll_interval (float): seconds between polls of the database
+            chunk_size (int): maximum number of rows in a yielded chunk
+
+        Yields:
+            dict: mapping of `step`, `phase`, `time` and metrics names to numpy arrays
+                ordered by step and phase, `time` is a unix timestamp. Missing values
+                are read as in `read`
+
+        Raises:
+            RarogException: if some metric doesn't exist in the experiment
+        """
+        if isinstance(metrics, str):
+            metrics = [metrics]
+        columns_types, conditions, params = self.__read_conditions(metrics, phase)
+        conditions.extend(self.__filled_conditions(metrics, columns_types))
+        if since_step is not None:
+            conditions.append('step >= %(since_step)s')
+            params['since_step'] = since_step
+        names = ['step', 'phase', 'time'] + list(metrics)
+        cursor = None
+        # representations of yielded rows of the cursor step
+        cursor_rows = set()
+        with self._stream_pool() as pool:
+            while True:
+                poll_conditions = list(conditions)
+                if cursor is not None:
+                    poll_conditions.append('step >= %(cursor_step)s')
+                    params['cursor_step'] = cursor
+                rows = pool.execute_iter(
+                    self.__values_query(metrics, columns_types, poll_conditions,
+                                        with_time=True),
+                    params, with_column_types=True, settings={'max_block_size': chunk_size})
+                # connection is released as soon as the caller stops iteration
+                with contextlib.closing(rows):
+                    result_types = next(rows, None)
+                    while True:
+                        chunk = list(itertools.islice(rows, chunk_size))
+                        if not chunk:
+                            break
+                        if cursor is not None:
+                            chunk = [row for row in chunk
+                                     if row[0] != cursor or repr(row) not in cursor_rows]
+                            if not chunk:
+                                continue
+                        # rows are ordered by step
+                        if cursor is None or chunk[-1][0] > cursor:
+                            cursor, cursor_rows = chunk[-1][0], set()
+                        cursor_rows.update(repr(row) for row in chunk if row[0] == cursor)
+                        yield self.__columnar_result_to_numpy(
+                            (list(zip(*chunk)), result_types), names)
+                sleep(poll_interval)
+
+    def __read_conditions(self, metrics, phase):
+        """Check that metrics exist and return conditions of queries that read them
+
+        Args:
+            metrics (list(str)): names of metrics
+            phase (str): phase of the experiment
+
+        Returns:
+            tuple: mapping of table columns to their types, list of conditions and
+                dict of parameters of the query
+
+        Raises:
+            RarogException: if some metric doesn't exist in the experiment
+        """
+        columns_types = self.__get_columns_types()
+        if any(metric not in columns_types for metric in metrics):
+            columns_types = self.__load_columns_types()
+        for metric in metrics:
+            if metric not in columns_types:
+                raise RarogException('Metric `{metric}` does not exist in `{name}`'.format(
+                    metric=metric, name=self.table))
+        conditions, params = [], {}
+        if phase is not None:
+            conditions.append('phase = %(phase)s')
+            params['phase'] = phase
+        if self.__narrow:
+            # metric is the first column of the ordering key, so only rows of metrics are read
+            conditions.append('metric IN ({metrics})'.format(metrics=', '.join(
+                '%(metric_{idx})s'.format(idx=idx) for idx in range(len(metrics)))))
+            params.update(
+                ('metric_{idx}'.format(idx=idx), metric) for idx, metric in enumerate(metrics))
+        return columns_types, conditions, params
+
+    def __filled_conditions(self, metrics, columns_types):
+        """Return conditions that skip rows without value of the single numeric metric,
+        such rows are traced without the metric and keep NULL in its column
+        """
+        if not self.__narrow and len(metrics) == 1 and \
+                is_numeric_click_type(columns_types[metrics[0]]):
+            return ['isNotNull({metric})'.format(metric=metrics[0])]
+        return []
+
+    def __values_query(self, metrics, columns_types, conditions, with_time=False):
+        """Build query that reads values of metrics ordered by step and phase
+
+        Args:
+            metrics (list(str)): names of metrics
+            columns_types (dict): mapping of table columns to their types
+            conditions (list(str)): conditions of the query
+            with_time (bool): select time of rows as unix timestamp after phase
+        """
+        columns = ['step', 'phase']
+        if with_time:
+            columns.append('toUInt32(max(time))' if self.__narrow else 'toUInt32(time)')
+        columns.extend(
+            self.__metric_column(idx, metric, columns_types[metric], nan_missing=len(metrics) > 1)
+            for idx, metric in enumerate(metrics))
+        group_by = ''
+        if self.__narrow:
+            group_by = 'GROUP BY step, phase{rank}'.format(
+                rank=', rank' if 'rank' in columns_types else '')
+        return 'SELECT {columns} FROM {table_name} {where} {group_by} ' \
+            'ORDER BY step, phase'.format(
+                columns=', '.join(columns), table_name=self.__read_table(),
+                where=where_clause(conditions), group_by=group_by)
+
+    def __read_table(self):
+        """Return table clause of queries that read values of metrics"""
+        if self.__layout['final']:
+            # replaced rows are removed only on merges, so queries should skip them
+            return '{table_name} FINAL'.format(table_name=self.table)
+        return self.table
+
+    def __metric_column(self, idx, metric, data_type, func=None, nan_missing=False):
+        """Return expression of the metric column of the query
+
+        Args:
+            idx (int): index of the metric in the query parameters
+            metric (str): name of the metric
+            data_type (str): clickhouse type of the metric
+            func (str): aggregate function applied to the values of the metric
+            nan_missing (bool): read numeric metric as Float64 with `nan` for rows and
+                buckets without its values, otherwise such rows should be filtered out
+        """
+        numeric = is_numeric_click_type(data_type)
+        if not self.__narrow:
+            column = metric if func is None else '{func}({metric})'.format(
+                func=func, metric=metric)
+            if numeric and nan_missing:
+                column = 'ifNull(toFloat64({column}), nan)'.format(column=column)
+            elif numeric:
+                column = 'assumeNotNull({column})'.format(column=column)
+            return column
+        arguments = '{value_column}, metric = %(metric_{idx})s'.format(
+            value_column=narrow_value_column(data_type), idx=idx)
+        if numeric and nan_missing:
+            return 'ifNull(toFloat64({func}OrNullIf({arguments})), nan)'.format(
+                func=func or 'any', arguments=arguments)
+        column = '{func}If({arguments})'.format(func=func or 'any', arguments=arguments)
+        if func is None:
+            # values are stored in the widest column of their kind, so they are cast back
+            column = 'CAST({column} AS {data_type})'.format(column=column, data_type=data_type)
+        return column
 
-    def __non_batch_tracing(self, name, value, step, phase):
+    def __rollup_query(self, metrics, aggregate, conditions, step_range, first_step,
+                       bucket_size, rollup_size):
+        """Build query that reads aggregated values of metrics from the rollup table,
+        buckets start from `first_step` aligned to buckets of the rollup
+        """
+        if step_range is not None:
+            conditions = conditions + [
+                'bucket BETWEEN intDiv(%(first_step)s, {size}) * {size} '
+                'AND %(last_step)s'.format(size=rollup_size)]
+        if len(metrics) == 1:
+            # buckets without values of the metric are skipped
+            conditions = conditions + ['{metric}__count > 0'.format(metric=metrics[0])]
+        # buckets without values of some metric are read as `nan`
+        templates = {
+            'avg': 'ifNull(sum({metric}__sum) / sum({metric}__count), nan)',
+            'min': 'ifNull(min({metric}__min), nan)',
+            'max': 'ifNull(max({metric}__max), nan)',
+            'sum': 'ifNull(sum({metric}__sum), nan)',
+        }
+        return '''SELECT intDiv(bucket - {first}, {size}) * {size} + {first} AS bucket_start,
+                phase, {columns}
+            FROM {rollup_name} {where}
+            GROUP BY bucket_start, phase
+            ORDER BY bucket_start, phase
+            '''.format(
+            first=first_step, size=bucket_size, rollup_name=self.__rollup_name(rollup_size),
+            columns=', '.join(templates[aggregate].format(metric=metric) for metric in metrics),
+            where=where_clause(conditions))
+
+    def __step_bounds(self, conditions, params, step_range):
+        """Return first and last steps that are split into buckets"""
+        if step_range is None:
+            (first_step, last_step), = self.execute(
+                'SELECT min(step), max(step) FROM {table_name} {where}'.format(
+                    table_name=self.table, where=where_clause(conditions)), params)
+            return first_step, last_step
+        return step_range
+
+    @staticmethod
+    def __columnar_result_to_numpy(result, names):
+        """Convert columnar result of the query to mapping of names to numpy arrays
+
+        Args:
+            result (tuple): columns and columns types returned by the database
+            names (list(str)): names of the columns in the returned mapping
+        """
+        columns, columns_types = result
+        if not columns:
+            columns = [[] for _ in columns_types]
+        return {
+            name: click_column_to_numpy(values, data_type)
+            for name, values, (_, data_type) in zip(names, columns, columns_types)}
+
+    def __non_batch_tracing(self, name, value, step, phase, rank=None):
         """Log metric by name straightway to the database
 
         Args:
@@ -166,32 +1756,47 @@ class Tracker(Manager):
             value (int, float, ..): value of the metric
             step (int): increment
             phase (str): phase of the experiment
+            rank (int): rank of the process that traced the value
         """
-        try:
-            self.execute(
-                'INSERT INTO {table_name} ({column_name}, step, phase) VALUES'.format(
-                    table_name=self.table, column_name=name),
-                [{name: check_value(value), 'step': step, 'phase': phase}])
-        except click_errors.ServerException as e:
-            if 'No such column' in e.message:
-                self.__add_column(name, value)
-                self.trace(name, value, step, phase)
-            else:
-                raise e
+        self.__non_batch_tracing_multy({name: value}, step, phase, rank)
 
-    def __non_batch_tracing_multy(self, names_to_values, step, phase):
+    def __non_batch_tracing_multy(self, names_to_values, step, phase, rank=None):
         """Log several metrics straightway to the database
 
         Args:
             names_to_values (dict): metric name to value mapping
             step (int): increment
             phase (str): phase of the experiment
+            rank (int): rank of the process that traced values
         """
-        columns_names = ','.join(list(names_to_values.keys()))
-        values = [{'step': step, 'phase': phase, **names_to_values}]
-        self.__write_batch_of_metrics(columns_names=columns_names, values=values)
+        if self.__reducers:
+            reduced_values = {
+                name: value for name, value in names_to_values.items()
+                if name in self.__reducers}
+            if reduced_values:
+                if step != self.__reduced_step:
+                    self.__write_reduced_values()
+                    self.__reduced_step = step
+                self.__reduced_values.append(reduced_values, step, phase, int(time()), rank)
+                names_to_values = {
+                    name: value for name, value in names_to_values.items()
+                    if name not in self.__reducers}
+                if not names_to_values:
+                    return
+        check = self.__metric_types.check
+        names_to_columns = {name: [check(name, value)] for name, value in names_to_values.items()}
+        names_to_columns.update({'step': [step], 'phase': [phase]})
+        if rank is not None:
+            names_to_columns['rank'] = [rank]
+        self.__write_batch_of_metrics(names_to_columns)
+
+    def __write_reduced_values(self):
+        """Write results of reducers accumulated for the last step"""
+        for names_to_columns in self.__reduced_values.batches():
+            self.__write_batch_of_metrics(names_to_columns)
+        self.__reduced_values.clear()
 
-    def __batch_tracing(self, name, value, step, phase):
+    def __batch_tracing(self, name, value, step, phase, rank=None):
         """Log metric by name with step or time batching
 
         Args:
@@ -199,55 +1804,235 @@ class Tracker(Manager):
             value (int, float, ..): value of the metric
             step (int): increment
             phase (str): phase of the experiment
+            rank (int): rank of the process that traced the value
         """
-        self.__batch_tracing_multy({name: value}, step, phase)
+        self.__batch_tracing_multy({name: value}, step, phase, rank)
 
-    def __batch_tracing_multy(self, names_to_values, step, phase):
-        """Log several metrics with step or time batching
+    def __wal_tracing(self, name, value, step, phase, rank=None):
+        """Log metric by name to the local log
 
         Args:
-            names_to_values (dict): metric name to value mapping
+            name (str): name of the metric
+            value (int, float, ..): value of the metric
             step (int): increment
             phase (str): phase of the experiment
+            rank (int): rank of the process that traced the value
+        """
+        self.__wal_tracing_multy({name: value}, step, phase, rank)
+
+    def __wal_tracing_multy(self, names_to_values, step, phase, rank=None):
+        """Log several metrics to the local log and write new records of the log to
+        the database with step or time batching
 
+        Args:
+            names_to_values (dict): metric name to value mapping
+            step (int): increment
+            phase (str): phase of the experiment
+            rank (int): rank of the process that traced values
         """
-        if (self.__sync_step and (step - self.__last_steps_sync) >= self.__sync_step) or \
-                (self.__sync_seconds and (time() - self.__last_time_sync) >= self.__sync_seconds):
-            self.sync_accumulated_values()
+        for name, value in names_to_values.items():
+            self.__metric_types.check(name, value)
+        self.__wal.append(names_to_values, step, phase, int(time()), rank)
+        if self.__offline or time() < self.__wal_retry_time:
+            return
+        if not self.__batching or self.__sync_is_due(step):
+            # reducers of the current step may still receive values, so it is written later
+            self.__keep_log_on_connection_error(
+                self.__sync_upload_values, step if self.__reducers else None)
             self.__last_steps_sync = step
             self.__last_time_sync = time()
-        update_dict = {**names_to_values, 'time': int(time())}
+
+    def __keep_log_on_connection_error(self, method, *args):
+        """Call method that writes to the database, on connection errors records are
+        kept in the local log, so they will be written on the next attempt
+        """
         try:
-            self.__upload_values[step][phase].update(update_dict)
-        except KeyError:
-            if step not in self.__upload_values:
-                self.__upload_values[step] = {}
-            self.__upload_values[step][phase] = update_dict
+            method(*args)
+        except connection_errors():
+            self.__stats['connection_errors'] += 1
+            self.__wal_retry_time = time() + WAL_RETRY_SECONDS
+
+    def __sync_log_values(self):
+        """Write records of the local log, keep them on connection errors"""
+        self.__keep_log_on_connection_error(self.__sync_upload_values)
+
+    def __sync_is_due(self, step):
+        """Check whether accumulated values should be written on this step"""
+        return (self.__sync_step and (step - self.__last_steps_sync) >= self.__sync_step) or \
+            (self.__sync_seconds and (time() - self.__last_time_sync) >= self.__sync_seconds)
+
+    def __sync_wal(self, held_step=None):
+        """Write records of the local log that are not in the database yet
+
+        Args:
+            held_step (int): records of this step and later ones are written later
+        """
+        if self.__offline:
+            self.__wal.sync()
+            return
+        buffer = ColumnarBuffer(reducers=self.__reducers, metric_types=self.__metric_types)
+        last_offset = None
+        for offset, record in self.__wal.records():
+            if record[1] == held_step:
+                break
+            if len(buffer) >= WAL_BATCH_ROWS:
+                self.__write_wal_batch(buffer, last_offset)
+            buffer.append(*record)
+            last_offset = offset
+        if len(buffer):
+            self.__write_wal_batch(buffer, last_offset)
+
+    def __write_wal_batch(self, buffer, offset):
+        """Write values read from the local log and mark them as written
+
+        Args:
+            buffer (ColumnarBuffer): values of the log records
+            offset (int): offset in the log after the last record of the buffer
+        """
+        for names_to_columns in buffer.batches():
+            self.__write_batch_of_metrics(names_to_columns)
+        self.__wal.commit(offset)
+        buffer.clear()
 
-    def __write_batch_of_metrics(self, columns_names, values):
-        """Write batch of values to the database. Create necessary columns if required.
+    def __batch_tracing_multy(self, names_to_values, step, phase, rank=None):
+        """Log several metrics with step or time batching
+
+        Args:
+            names_to_values (dict): metric name to value mapping
+            step (int): increment
+            phase (str): phase of the experiment
+            rank (int): rank of the process that traced values
+        """
+        # reducers of the current step may still receive values, so its rows are kept
+        held_step = step if self.__reducers else None
+        if self.__sync_is_due(step):
+            self.__sync_upload_values(held_step)
+            self.__last_steps_sync = step
+            self.__last_time_sync = time()
+        self.__upload_values.append(names_to_values, step, phase, int(time()), rank)
+        if (self.__max_buffer_rows and len(self.__upload_values) >= self.__max_buffer_rows) or \
+                (self.__max_buffer_bytes and
+                 self.__upload_values.nbytes >= self.__max_buffer_bytes):
+            if self.__flushing and self.__spill_dir is not None:
+                # values are traced by the flush hook, so they can't be written now
+                self.__spill(self.__upload_values.batches(held_step))
+                self.__upload_values.clear(held_step)
+            else:
+                # values that failed to be written because of connection errors are spilled
+                self.__sync_upload_values(held_step)
+
+    def __write_batch_of_metrics(self, names_to_columns, retry=True):
+        """Write batch of values to the database in columnar form.
+        Create necessary columns if required.
 
         Args:
-            columns_names (str): comma separated names of the columns
-            values (list(dict)): list with mapping of inserted values
+            names_to_columns (dict): mapping of column names to lists of inserted values
+            retry (bool): reload table schema and retry if some column was not found
         """
+        self.__prepare_table()
+        if self.__narrow:
+            for narrow_columns in self.__to_narrow(names_to_columns):
+                self.__insert(narrow_columns)
+            return
+        self.__add_missing_columns(names_to_columns)
         try:
-            values = [
-                {key: check_value(value) for key, value in values_dict.items()} for
-                values_dict in values
-            ]
-            self.execute(
-                'INSERT INTO {table_name} ({columns_names}, step, phase) VALUES'.format(
-                    table_name=self.table, columns_names=columns_names), values
-            )
-        except click_errors.ServerException as e:
-            if 'No such column' in e.message:
-                missed_column_name = e.message.split('No such column ')[-1].split(' in table')[0]
-                self.__add_column(missed_column_name, values[0][missed_column_name])
-                self.__write_batch_of_metrics(columns_names, values)
+            self.__insert(names_to_columns)
+        except import_click_errors().ServerException as e:
+            if retry and 'No such column' in e.message:
+                # table was changed outside of the tracker, so cached schema is outdated
+                self.__stats['schema_retries'] += 1
+                self.__columns_types = None
+                self.__write_batch_of_metrics(names_to_columns, retry=False)
             else:
                 raise e
 
+    def __insert(self, names_to_columns):
+        """Insert columns of values into the experiment table
+
+        Args:
+            names_to_columns (dict): mapping of column names to lists of inserted values
+        """
+        columns = list(names_to_columns.values())
+        self.execute(
+            'INSERT INTO {table_name} ({columns_names}) VALUES'.format(
+                table_name=self.table, columns_names=','.join(names_to_columns)),
+            columns, columnar=True
+        )
+        self.__stats['inserts'] += 1
+        self.__stats['rows_sent'] += len(columns[0])
+        # estimated by the first value of every column to keep the overhead low
+        self.__stats['bytes_sent'] += sum(
+            value_nbytes(column[0]) * len(column) for column in columns)
+
+    def __to_narrow(self, names_to_columns):
+        """Convert batch of values to columns of the narrow table, one batch per value
+        column used by the metrics
+
+        Args:
+            names_to_columns (dict): mapping of column names to lists of values
+
+        Returns:
+            list(dict): mapping of narrow table column names to lists of values
+        """
+        service_columns = {
+            name: column for name, column in names_to_columns.items()
+            if name in SERVICE_COLUMNS}
+        rows_count = len(names_to_columns['step'])
+        batches = {}
+        for name, column in names_to_columns.items():
+            if name in SERVICE_COLUMNS:
+                continue
+            data_type = self.__column_type(name, column[0])
+            value_column = narrow_value_column(data_type)
+            batch = batches.get(value_column)
+            if batch is None:
+                batch = batches[value_column] = {
+                    key: [] for key in list(service_columns) + ['metric', 'type', value_column]}
+            for key, values in service_columns.items():
+                batch[key].extend(values)
+            batch['metric'].extend([name] * rows_count)
+            batch['type'].extend([data_type] * rows_count)
+            batch[value_column].extend(column)
+            if self.__columns_types is not None:
+                self.__columns_types.setdefault(name, data_type)
+        return list(batches.values())
+
+    def __load_columns_types(self):
+        """Load mapping of table columns to their types from the database and cache it,
+        for narrow table metrics are mapped to their types instead of value columns
+        """
+        self.__prepare_table()
+        columns_types = {
+            col[0]: strip_nullable(col[1])
+            for col in self.execute('DESCRIBE TABLE {name}'.format(name=self.table))}
+        if self.__narrow:
+            columns_types = {
+                name: data_type for name, data_type in columns_types.items()
+                if name not in NARROW_COLUMNS}
+            columns_types.update(self.execute(
+                'SELECT metric, any(type) FROM {name} GROUP BY metric'.format(name=self.table)))
+        self.__columns_types = columns_types
+        return self.__columns_types
+
+    def __get_columns_types(self):
+        """Return cached mapping of table columns to their types, load it if required"""
+        if self.__columns_types is None:
+            return self.__load_columns_types()
+        return self.__columns_types
+
+    def __add_missing_columns(self, names_to_columns):
+        """Add columns that are absent in the cached table schema
+
+        Args:
+            names_to_columns (dict): mapping of column names to lists of inserted values
+        """
+        columns_types = self.__get_columns_types()
+        missed_columns = {
+            name: column[0] for name, column in names_to_columns.items()
+            if name not in columns_types}
+        if missed_columns:
+            self.__add_columns(missed_columns)
+
     def __add_column(self, name, value):
         """Add required column to the experiment table
 
@@ -255,38 +2040,329 @@ class Tracker(Manager):
             name (str): column name
             value (any): value example to be stored in the column
         """
-        data_type = python_type_to_click(value)
-        self.execute('ALTER TABLE {table_name} ADD COLUMN {column_name} {data_type}'.format(
-            table_name=self.table, column_name=name, data_type=data_type))
+        self.__add_columns({name: value})
+
+    def __add_columns(self, names_to_values):
+        """Add several columns to the experiment table with a single query
+
+        Args:
+            names_to_values (dict): mapping of column names to value examples
+        """
+        names_to_types = {
+            name: self.__column_type(name, value) for name, value in names_to_values.items()}
+        self.execute('ALTER TABLE {table_name} {add_columns}'.format(
+            table_name=self.table,
+            add_columns=', '.join(
+                'ADD COLUMN IF NOT EXISTS {column_name} {data_type}{codec}'.format(
+                    column_name=name, data_type=metric_column_type(data_type),
+                    codec=click_column_codec(data_type) if self.__codecs else '')
+                for name, data_type in names_to_types.items())))
+        self.__get_columns_types().update(names_to_types)
+        self.__stats['schema_changes'] += 1
+        if self.__on_schema_change is not None:
+            self.__on_schema_change(names_to_types)
+        if self.__rollups and any(map(is_numeric_click_type, names_to_types.values())):
+            self.__update_rollups()
+
+    def __column_type(self, name, value):
+        """Return clickhouse type of the metric column
 
-    def trace(self, name, value, step, phase='train'):
+        Args:
+            name (str): name of the metric
+            value (any): value example to be stored in the column
+        """
+        # results of reducers may have another type than traced values
+        if name in self.__metric_types and name not in self.__reducers:
+            return self.__metric_types.get(name)
+        return python_type_to_click(value)
+
+    def trace(self, name, value, step, phase='train', rank=None):
         """Log metric by name by batches or straightway
 
         Args:
             name (str): name of the metric
-            value (int, float, ..): value of the metric
+            value (int, float, ..): value of the metric, arrays and tensors of any shape
+                and `Histogram` are accepted too, see `expand_values`
             step (int): increment
             phase (str): phase of the experiment
+            rank (int): rank of the process that traced the value, should be provided
+                only for tracker with `ranked=True`
         """
-        self.__trace_method(name=name, value=value, step=step, phase=phase)
+        # arrays go through `multy_trace` to be copied, lists are checked as well, so
+        # the check doesn't import numpy
+        if not is_plain_value(value) or name in self.__samplers or (
+                self.__copies_arrays and type(value) not in PYTHON_DATATYPE_TO_CLICKHOUSE):
+            self.multy_trace({name: value}, step, phase=phase, rank=rank)
+            return
+        if self.__queue is not None:
+            self.__enqueue(self.__trace_method, name=name, value=value, step=step, phase=phase,
+                           rank=rank)
+        else:
+            self.__trace_method(name=name, value=value, step=step, phase=phase, rank=rank)
 
-    def multy_trace(self, names_to_values, step, phase='train'):
+    def multy_trace(self, names_to_values, step, phase='train', rank=None):
         """Log several metrics
 
         Args:
             names_to_values (dict): metric name to value mapping
             step (int): increment
             phase (str): phase of the experiment
+            rank (int): rank of the process that traced values, should be provided
+                only for tracker with `ranked=True`
+        """
+        if self.__samplers and not self.__samplers.keys().isdisjoint(names_to_values):
+            for sampled_step, sampled_values in self.__apply_samplers(
+                    names_to_values, step, phase, rank).items():
+                self.__multy_trace(sampled_values, sampled_step, phase, rank)
+        else:
+            self.__multy_trace(names_to_values, step, phase, rank)
+
+    def __multy_trace(self, names_to_values, step, phase, rank):
+        """Pass values to the trace method or the background thread"""
+        if self.__copies_arrays:
+            names_to_values = copy_plain_arrays(names_to_values)
+        names_to_values = expand_values(names_to_values)
+        if self.__queue is not None:
+            # copy mapping, so caller may reuse it while the value waits in the queue
+            self.__enqueue(self.__multy_trace_method, names_to_values=dict(names_to_values),
+                           step=step, phase=phase, rank=rank)
+        else:
+            self.__multy_trace_method(names_to_values=names_to_values, step=step, phase=phase,
+                                      rank=rank)
+
+    def __apply_samplers(self, names_to_values, step, phase, rank):
+        """Pass values of sampled metrics through samplers of their phases
+
+        Returns:
+            dict: mapping of steps to values kept for them, it includes values of
+                previous steps released by samplers
+        """
+        import numpy as np
+        steps_to_values = {}
+        kept_values = {}
+        for name, value in names_to_values.items():
+            if name not in self.__samplers:
+                kept_values[name] = value
+                continue
+            sampler = self.__phase_samplers.get((name, phase, rank))
+            if sampler is None:
+                sampler = self.__phase_samplers[(name, phase, rank)] = copy.deepcopy(
+                    self.__samplers[name])
+            if isinstance(value, np.ndarray) or \
+                    not (is_plain_value(value) or isinstance(value, Histogram)):
+                # samplers may hold the value for later steps, so array or tensor is copied
+                value = np.array(to_numpy(value))
+            released = sampler.update(step, value)
+            self.__stats['sampled_out'] += 1 - len(released)
+            for released_step, released_value in released:
+                steps_to_values.setdefault(released_step, {})[name] = released_value
+        if kept_values:
+            steps_to_values.setdefault(step, {}).update(kept_values)
+        return steps_to_values
+
+    def __release_sampled_values(self):
+        """Trace values held by samplers"""
+        rows = {}
+        for (name, phase, rank), sampler in self.__phase_samplers.items():
+            released = sampler.flush()
+            self.__stats['sampled_out'] -= len(released)
+            for released_step, released_value in released:
+                rows.setdefault((released_step, phase, rank), {})[name] = released_value
+        for (step, phase, rank), names_to_values in sorted(
+                rows.items(), key=lambda row: row[0][0]):
+            self.__multy_trace(names_to_values, step, phase, rank)
+
+    def __enqueue(self, method, **kwargs):
+        """Pass call to the background thread
+
+        Raises:
+            RarogException: if tracker was already closed
+        """
+        if self.__closed:
+            raise RarogException('Tracker `{name}` is closed'.format(name=self.table))
+        self.__raise_writer_error()
+        self.__queue.put((method, kwargs))
+
+    def __drain_queue(self):
+        """Execute enqueued calls until stop marker is received"""
+        while True:
+            method, kwargs = self.__queue.get()
+            try:
+                if method is None:
+                    return
+                # after a failure calls are skipped until the error is reported to the user
+                if self.__writer_error is None:
+                    method(**kwargs)
+            except Exception as e:
+                self.__writer_error = e
+            finally:
+                self.__queue.task_done()
+
+    def __raise_writer_error(self):
+        """Re-raise exception that happened in the background thread"""
+        if self.__writer_error is not None:
+            error, self.__writer_error = self.__writer_error, None
+            raise error
+
+    def flush(self):
+        """Write all traced values to the database and wait until it is done
+
+        Records of the local log that failed to be written because of connection errors
+        are kept in the log, `stats` counts such errors.
         """
-        self.__multy_trace_method(names_to_values=names_to_values, step=step, phase=phase)
+        sync = self.__sync_upload_values if self.__wal is None else self.__sync_log_values
+        if self.__queue is not None:
+            self.__enqueue(sync)
+            self.__queue.join()
+            self.__raise_writer_error()
+        else:
+            sync()
+
+    def close(self):
+        """Flush traced values, stop background thread and disconnect from the database"""
+        if self.__closed:
+            return
+        try:
+            self.__release_sampled_values()
+            self.flush()
+        finally:
+            self.__closed = True
+            if self.__queue is not None:
+                self.__queue.put((None, None))
+                self.__writer.join()
+            if self.__wal is not None:
+                self.__wal.close()
+            self.disconnect()
 
     def sync_accumulated_values(self):
         """Sync accumulated values to the db"""
-        columns_to_values = defaultdict(list)
-        for step, step_data in self.__upload_values.items():
-            for phase, phase_data in step_data.items():
-                columns_to_values[','.join(phase_data.keys())].append({
-                    'step': step, 'phase': phase, **phase_data})
-        for columns_names, values in columns_to_values.items():
-            self.__write_batch_of_metrics(columns_names=columns_names, values=values)
-        self.__upload_values = {}
+        self.flush()
+
+    def stats(self):
+        """Return snapshot of the tracker counters
+
+        Returns:
+            dict: values accumulated in memory (`buffered_rows`, `buffered_bytes`),
+                calls waiting for the background thread (`queue_depth`), segments
+                waiting to be written (`pending_segments`), number and total duration
+                of writes of accumulated values (`flushes`, `flush_seconds`,
+                `last_flush_seconds`), number of insert queries and rows and approximate
+                bytes sent with them (`inserts`, `rows_sent`, `bytes_sent`), number of
+                queries that added columns (`schema_changes`), inserts retried after
+                reload of outdated schema (`schema_retries`), connection errors after
+                which values were kept for the next attempt (`connection_errors`),
+                spilled segments (`spilled_segments`) and values dropped or held by
+                samplers (`sampled_out`)
+        """
+        if self.__wal is not None:
+            buffer = None
+        elif self.__batching:
+            buffer = self.__upload_values
+        else:
+            buffer = self.__reduced_values
+        return dict(
+            self.__stats,
+            buffered_rows=len(buffer) if buffer is not None else 0,
+            buffered_bytes=buffer.nbytes if buffer is not None else 0,
+            queue_depth=self.__queue.qsize() if self.__queue is not None else 0,
+            pending_segments=len(self.__spilled_segments)
+            if self.__wal is None and self.__batching else 0,
+        )
+
+    def __sync_upload_values(self, held_step=None):
+        """Write accumulated values to the database, update counters and call the hook
+
+        Args:
+            held_step (int): values of this step are kept for the next write
+        """
+        stats = self.__stats
+        inserts, rows_sent, bytes_sent = \
+            stats['inserts'], stats['rows_sent'], stats['bytes_sent']
+        error = None
+        start = perf_counter()
+        self.__flushing = True
+        try:
+            self.__write_upload_values(held_step)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = perf_counter() - start
+            stats['flushes'] += 1
+            stats['flush_seconds'] += seconds
+            stats['last_flush_seconds'] = seconds
+            try:
+                if self.__on_flush is not None:
+                    self.__on_flush({
+                        'rows': stats['rows_sent'] - rows_sent,
+                        'bytes': stats['bytes_sent'] - bytes_sent,
+                        'inserts': stats['inserts'] - inserts,
+                        'seconds': seconds,
+                        'error': error,
+                    })
+            finally:
+                self.__flushing = False
+
+    def __write_upload_values(self, held_step=None):
+        """Write accumulated values to the database
+
+        Args:
+            held_step (int): values of this step are kept for the next write
+        """
+        if self.__wal is not None:
+            self.__sync_wal(held_step)
+            return
+        if not self.__batching:
+            self.__write_reduced_values()
+            return
+        batches = self.__upload_values.batches(held_step)
+        written = 0
+        try:
+            self.__write_spilled_segments()
+            for names_to_columns in batches:
+                self.__write_batch_of_metrics(names_to_columns)
+                written += 1
+        except connection_errors():
+            if self.__spill_dir is None:
+                raise
+            self.__stats['connection_errors'] += 1
+            self.__spill(batches[written:])
+        self.__upload_values.clear(held_step)
+
+    def __spill(self, batches):
+        """Dump batches of accumulated values to the new segment file
+
+        Args:
+            batches (list(dict)): mappings of column names to lists of values
+        """
+        if not batches:
+            return
+        os.makedirs(self.__spill_dir, exist_ok=True)
+        path = os.path.join(self.__spill_dir, '{table_name}-{pid}-{idx:06d}.spill'.format(
+            table_name=self.table, pid=os.getpid(), idx=self.__spill_counter))
+        self.__spill_counter += 1
+        self.__stats['spilled_segments'] += 1
+        self.__dump_segment(path, batches)
+        self.__spilled_segments.append(path)
+
+    @staticmethod
+    def __dump_segment(path, batches):
+        """Write batches of accumulated values to the segment file"""
+        with open(path, 'wb') as f:
+            pickle.dump(batches, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __write_spilled_segments(self):
+        """Write spilled segments to the database in order they were created"""
+        while self.__spilled_segments:
+            path = self.__spilled_segments[0]
+            with open(path, 'rb') as f:
+                batches = pickle.load(f)
+            for idx, names_to_columns in enumerate(batches):
+                try:
+                    self.__write_batch_of_metrics(names_to_columns)
+                except Exception:
+                    # keep only values that were not written yet
+                    self.__dump_segment(path, batches[idx:])
+                    raise
+            os.remove(path)
+            self.__spilled_segments.pop(0)
@@ -0,0 +1,239 @@
+import multiprocessing
+import os
+import queue
+import threading
+from multiprocessing.connection import Client as ConnectionClient, Listener
+
+from .core import RarogException, Tracker, expand_values
+
+
+# maximum number of received messages waiting for the writer by default
+MAX_PENDING_MESSAGES = 64
+
+
+class TrackerServer:
+    """Single writer that merges values traced by several processes
+
+    Worker processes send values with `RemoteTracker` through a local socket, writer
+    tags them with rank of the worker and stores them with one `Tracker`, so there is
+    only one connection and one stream of batched inserts to the database.
+    """
+
+    def __init__(self, name, address=None, authkey=None, sync_seconds=1,
+                 max_pending=MAX_PENDING_MESSAGES, **tracker_kwargs):
+        """
+        Args:
+            name (str): name of experiment to be logged
+            address (str or tuple): address of the socket, if `None` free address
+                is chosen
+            authkey (bytes): key to authenticate workers connections, random by default.
+                Messages of authenticated connections are unpickled by the writer, so
+                the key should be kept secret
+            sync_seconds (int): time frequency for dumping results into database
+            max_pending (int): maximum number of received messages waiting for the
+                writer. When it is reached, messages of workers are not read, so workers
+                block on sending until the writer catches up with the database
+            tracker_kwargs: other arguments of the `Tracker`
+        """
+        self.name = name
+        self.address = address
+        self.authkey = authkey if authkey is not None else os.urandom(32)
+        self.tracker_kwargs = dict(tracker_kwargs, sync_seconds=sync_seconds)
+        self.max_pending = max_pending
+        self.__process = None
+
+    def start(self):
+        """Start writer in a separate process
+
+        Returns:
+            tuple: address and authentication key that should be passed to `RemoteTracker`
+
+        Raises:
+            RarogException: if writer failed to start
+        """
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.__process = multiprocessing.Process(
+            target=serve, args=(self.name, self.address, self.authkey, self.tracker_kwargs,
+                                child_conn, self.max_pending),
+            name='rarog-writer-{}'.format(self.name), daemon=True)
+        self.__process.start()
+        status, result = parent_conn.recv()
+        if status == 'error':
+            self.__process.join()
+            raise RarogException('Writer failed to start: {error}'.format(error=result))
+        self.address = result
+        return self.address, self.authkey
+
+    def serve_forever(self):
+        """Run writer in the current process until `stop` is called"""
+        serve(self.name, self.address, self.authkey, self.tracker_kwargs,
+              max_pending=self.max_pending)
+
+    def stop(self):
+        """Write remaining values and stop the writer"""
+        with ConnectionClient(self.address, authkey=self.authkey) as conn:
+            conn.send(('stop',))
+            conn.recv()
+        if self.__process is not None:
+            self.__process.join()
+            self.__process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def serve(name, address, authkey, tracker_kwargs, ready_conn=None,
+          max_pending=MAX_PENDING_MESSAGES):
+    """Accept workers connections and write their values until stop message is received
+
+    Args:
+        name (str): name of experiment to be logged
+        address (str or tuple): address of the socket
+        authkey (bytes): key to authenticate workers connections
+        tracker_kwargs (dict): arguments of the `Tracker`
+        ready_conn (multiprocessing.connection.Connection): connection to report
+            address of the socket or startup error
+        max_pending (int): maximum number of received messages waiting for the writer
+    """
+    try:
+        tracker = Tracker(name, ranked=True, exist_ok=True, **tracker_kwargs)
+        listener = Listener(address, authkey=authkey)
+    except Exception as e:
+        if ready_conn is None:
+            raise
+        ready_conn.send(('error', repr(e)))
+        return
+    if ready_conn is not None:
+        ready_conn.send(('ok', listener.address))
+        ready_conn.close()
+
+    # readers block when the queue is full, so workers can't outpace the database
+    messages = queue.Queue(maxsize=max_pending)
+    threading.Thread(target=_accept, args=(listener, messages), daemon=True).start()
+    error = None
+    while True:
+        kind, payload = messages.get()
+        try:
+            if kind == 'trace':
+                # after a failure values are skipped until the error is reported on flush
+                if error is None:
+                    for names_to_values, step, phase, rank in payload:
+                        tracker.multy_trace(names_to_values, step, phase, rank=rank)
+            elif kind == 'flush':
+                if error is None:
+                    tracker.flush()
+            else:
+                tracker.close()
+        except Exception as e:
+            error = repr(e)
+        if kind == 'trace':
+            continue
+        payload.put(error)
+        error = None
+        if kind == 'stop':
+            # wait until the reply is sent, otherwise the process may exit before it
+            payload.join()
+            listener.close()
+            return
+
+
+def _accept(listener, messages):
+    """Start reading thread for every new connection"""
+    while True:
+        try:
+            conn = listener.accept()
+        except OSError:
+            return
+        threading.Thread(target=_receive, args=(conn, messages), daemon=True).start()
+
+
+def _receive(conn, messages):
+    """Pass messages of the connection to the writer and send replies back"""
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == 'trace':
+                messages.put(message)
+            else:
+                reply = queue.Queue(maxsize=1)
+                messages.put((message[0], reply))
+                conn.send(reply.get())
+                reply.task_done()
+
+
+class RemoteTracker:
+    """Send traced values to the `TrackerServer` of the experiment"""
+
+    def __init__(self, address, rank, authkey, send_every=1000):
+        """
+        Args:
+            address (str or tuple): address returned by `TrackerServer.start`
+            rank (int): rank of the current process
+            authkey (bytes): key returned by `TrackerServer.start`
+            send_every (int): number of records sent to the writer with one message
+        """
+        self.rank = rank
+        self.__send_every = send_every
+        self.__records = []
+        self.__conn = ConnectionClient(address, authkey=authkey)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def trace(self, name, value, step, phase='train'):
+        """Log metric by name
+
+        Args:
+            name (str): name of the metric
+            value (int, float, ..): value of the metric
+            step (int): increment
+            phase (str): phase of the experiment
+        """
+        self.multy_trace({name: value}, step, phase)
+
+    def multy_trace(self, names_to_values, step, phase='train'):
+        """Log several metrics
+
+        Args:
+            names_to_values (dict): metric name to value mapping
+            step (int): increment
+            phase (str): phase of the experiment
+        """
+        # tensors are converted in the worker, so the writer doesn't depend on their library
+        self.__records.append((expand_values(dict(names_to_values)), step, phase, self.rank))
+        if len(self.__records) >= self.__send_every:
+            self.__send_records()
+
+    def __send_records(self):
+        if self.__records:
+            self.__conn.send(('trace', self.__records))
+            self.__records = []
+
+    def flush(self):
+        """Send traced values and wait until the writer stores them in the database
+
+        Raises:
+            RarogException: if writer failed to store values
+        """
+        self.__send_records()
+        self.__conn.send(('flush',))
+        error = self.__conn.recv()
+        if error is not None:
+            raise RarogException('Writer failed to store values: {error}'.format(error=error))
+
+    def close(self):
+        """Flush traced values and close connection to the writer"""
+        try:
+            self.flush()
+        finally:
+            self.__conn.close()
@@ -0,0 +1,92 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+from .core import RarogException
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections shared by managers and trackers
+
+    Connections are opened lazily, up to `size` of them, and the most recently used one
+    is reused first, so a few warm connections serve any number of experiments.
+    """
+
+    def __init__(self, host='localhost', size=4, timeout=None, *args, **kwargs):
+        """
+        Args:
+            host (str): database host
+            size (int): maximum number of open connections
+            timeout (float): seconds to wait for a free connection, forever by default
+            args, kwargs: other arguments of the `clickhouse_driver.Client`
+        """
+        self.size = size
+        self.timeout = timeout
+        self.__client_args = (host,) + args
+        self.__client_kwargs = kwargs
+        self.__idle = queue.LifoQueue()
+        self.__created = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def created(self):
+        """Number of connections opened by the pool"""
+        return self.__created
+
+    def __acquire(self):
+        try:
+            return self.__idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.__lock:
+            if self.__created < self.size:
+                from clickhouse_driver import Client
+                self.__created += 1
+                return Client(*self.__client_args, **self.__client_kwargs)
+        try:
+            return self.__idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RarogException('No free connection in the pool after {timeout} seconds'.format(
+                timeout=self.timeout))
+
+    @contextmanager
+    def connection(self):
+        """Borrow connection for the duration of the block
+
+        Raises:
+            RarogException: if there is no free connection after `timeout` seconds
+        """
+        client = self.__acquire()
+        try:
+            yield client
+        finally:
+            self.__idle.put(client)
+
+    def execute(self, *args, **kwargs):
+        """Execute query with a borrowed connection"""
+        with self.connection() as client:
+            return client.execute(*args, **kwargs)
+
+    def execute_iter(self, *args, **kwargs):
+        """Execute query with a borrowed connection and iterate over rows of the result,
+        connection is returned when iteration is finished
+        """
+        with self.connection() as client:
+            try:
+                yield from client.execute_iter(*args, **kwargs)
+            except BaseException:
+                # rest of the result is still sent by the server, so the connection
+                # is closed and reopened by the next query
+                client.disconnect()
+                raise
+
+    def disconnect(self):
+        """Close idle connections of the pool"""
+        while True:
+            try:
+                client = self.__idle.get_nowait()
+            except queue.Empty:
+                return
+            client.disconnect()
+            with self.__lock:
+                self.__created -= 1
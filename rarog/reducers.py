@@ -0,0 +1,118 @@
+import math
+
+
+class Reducer:
+    """Fold values traced for the same step and phase into a single value"""
+
+    def update(self, value):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class Mean(Reducer):
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+
+    def update(self, value):
+        self.count += 1
+        self.mean += (value - self.mean) / self.count
+
+    def result(self):
+        return self.mean
+
+
+class Sum(Reducer):
+    def __init__(self):
+        self.sum = 0
+
+    def update(self, value):
+        self.sum += value
+
+    def result(self):
+        return self.sum
+
+
+class Min(Reducer):
+    def __init__(self):
+        self.min = None
+
+    def update(self, value):
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def result(self):
+        return self.min
+
+
+class Max(Reducer):
+    def __init__(self):
+        self.max = None
+
+    def update(self, value):
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def result(self):
+        return self.max
+
+
+class Last(Reducer):
+    def __init__(self):
+        self.last = None
+
+    def update(self, value):
+        self.last = value
+
+    def result(self):
+        return self.last
+
+
+class Count(Reducer):
+    def __init__(self):
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+
+    def result(self):
+        return self.count
+
+
+class Variance(Reducer):
+    """Population variance computed with Welford's streaming algorithm"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def result(self):
+        return self.m2 / self.count
+
+
+class Std(Variance):
+    """Population standard deviation computed with Welford's streaming algorithm"""
+
+    def result(self):
+        return math.sqrt(super().result())
+
+
+REDUCERS = {
+    'mean': Mean,
+    'sum': Sum,
+    'min': Min,
+    'max': Max,
+    'last': Last,
+    'count': Count,
+    'var': Variance,
+    'std': Std,
+}
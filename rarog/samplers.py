@@ -0,0 +1,147 @@
+import random
+from time import monotonic
+
+
+class Sampler:
+    """Decide which values of a metric are traced
+
+    Tracker keeps a separate copy of the sampler for every phase of the metric and
+    passes values to it in the order they were traced, before they are buffered.
+    Samplers that hold values release them later as separate rows of their steps.
+    """
+
+    # whether values may be released after values of later steps
+    holds_values = False
+
+    def update(self, step, value):
+        """Offer traced value to the sampler
+
+        Returns:
+            list(tuple): (step, value) pairs to be traced now, they may include values
+                of previous steps held by the sampler
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """Return (step, value) pairs held by the sampler, called on close of the tracker"""
+        return []
+
+
+class EveryNth(Sampler):
+    """Keep values of every n-th step, so rows of metrics with the same `n` coincide"""
+
+    def __init__(self, n):
+        self.n = n
+
+    def update(self, step, value):
+        return [(step, value)] if step % self.n == 0 else []
+
+
+class MaxRate(Sampler):
+    """Keep at most `rate` values per second, values that come faster are dropped"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_time = 0.0
+
+    def update(self, step, value):
+        now = monotonic()
+        if now < self.next_time:
+            return []
+        self.next_time = now + self.interval
+        return [(step, value)]
+
+
+class Reservoir(Sampler):
+    """Keep `size` values chosen uniformly at random from every window of `window` steps
+
+    Values of a window are held until the first value of the next window or `flush`.
+    """
+
+    holds_values = True
+
+    def __init__(self, size, window, seed=None):
+        self.size = size
+        self.window = window
+        self.random = random.Random(seed)
+        self.window_start = None
+        self.seen = 0
+        self.reservoir = []
+
+    def update(self, step, value):
+        released = []
+        window_start = step - step % self.window
+        if window_start != self.window_start:
+            released = self.flush()
+            self.window_start = window_start
+        self.seen += 1
+        if len(self.reservoir) < self.size:
+            self.reservoir.append((step, value))
+        else:
+            idx = self.random.randrange(self.seen)
+            if idx < self.size:
+                self.reservoir[idx] = (step, value)
+        return released
+
+    def flush(self):
+        released = sorted(self.reservoir, key=lambda pair: pair[0])
+        self.reservoir = []
+        self.seen = 0
+        return released
+
+
+class KeepExtremes(Sampler):
+    """Keep values kept by another sampler and also the minimum and the maximum of every
+    window of `window` steps, so spikes are never dropped
+
+    Extremes of a window are held until the first value of the next window or `flush`.
+    Values should be comparable, e.g. numbers.
+    """
+
+    holds_values = True
+
+    def __init__(self, sampler=None, window=1000):
+        """
+        Args:
+            sampler (Sampler): sampler of the other values, only extremes are kept
+                if not provided. Windows of a reservoir should be the same
+            window (int): number of steps in a window
+        """
+        self.sampler = sampler
+        self.window = window
+        self.window_start = None
+        self.low = self.high = None
+        self.kept_steps = set()
+
+    def update(self, step, value):
+        kept = self.sampler.update(step, value) if self.sampler is not None else []
+        released = []
+        window_start = step - step % self.window
+        if window_start != self.window_start:
+            released = self.__release(kept)
+            self.window_start = window_start
+        self.kept_steps.update(kept_step for kept_step, _ in kept)
+        if self.low is None or value < self.low[1]:
+            self.low = (step, value)
+        if self.high is None or value > self.high[1]:
+            self.high = (step, value)
+        return released + kept
+
+    def flush(self):
+        kept = self.sampler.flush() if self.sampler is not None else []
+        return sorted(self.__release(kept) + kept, key=lambda pair: pair[0])
+
+    def __release(self, kept):
+        """Return extremes of the window that were not kept by the other sampler and
+        start the next window
+        """
+        kept_steps = self.kept_steps.union(kept_step for kept_step, _ in kept)
+        released = []
+        extremes = [extreme for extreme in (self.low, self.high) if extreme is not None]
+        for extreme in sorted(extremes, key=lambda pair: pair[0]):
+            if extreme[0] not in kept_steps:
+                kept_steps.add(extreme[0])
+                released.append(extreme)
+        self.low = self.high = None
+        self.kept_steps = set()
+        return released
@@ -0,0 +1,195 @@
+import mmap
+import os
+import pickle
+import struct
+
+from .core import RarogException
+
+
+MAGIC = b'RAROGWAL\x01'
+FRAME_HEADER = struct.Struct('<I')
+
+
+class WriteAheadLog:
+    """Append-only local log of traced values
+
+    Log starts with magic bytes and a header frame with experiment name and options of
+    its table, followed by frames with traced records. Every frame is a length-prefixed
+    pickle, so the log may be read back through memory mapping without loading it into
+    memory. Offset of the records already written to the database is kept in
+    `<path>.offset` file. When all records are written, the log is truncated back to
+    its header.
+    """
+
+    def __init__(self, path, table, options=None):
+        """Open existing log or create a new one
+
+        Frame that was not fully written before a crash is cut off, so new records
+        are appended after the last complete one.
+
+        Args:
+            path (str): path to the log file
+            table (str): name of the experiment, stored in the header of a new log
+            options (dict): arguments of the tracker that define the table, e.g. storage
+                and layout, stored in the header of a new log
+
+        Raises:
+            RarogException: if file is not a rarog log
+        """
+        self.path = path
+        bounds = log_bounds(path) if os.path.exists(path) else None
+        self.__file = open(path, 'ab')
+        if bounds is None:
+            # new log, or the header was not fully written
+            self.__file.truncate(0)
+            self.__file.write(MAGIC)
+            self.__write_frame({'table': table, 'options': dict(options or {})})
+            self.__file.flush()
+            bounds = log_bounds(path)
+        elif bounds[1] < os.fstat(self.__file.fileno()).st_size:
+            self.__file.truncate(bounds[1])
+        self.__header_end, end = bounds
+        if self.committed > end:
+            # log was truncated after the last commit, but the offset was not updated
+            self.commit(self.__header_end)
+        header = read_header(path)
+        self.table = header['table']
+        # logs written by older versions have no options
+        self.options = header.get('options', {})
+
+    def __write_frame(self, payload):
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__file.write(FRAME_HEADER.pack(len(data)))
+        self.__file.write(data)
+
+    def append(self, names_to_values, step, phase, timestamp, rank=None):
+        """Append record to the log
+
+        Args:
+            names_to_values (dict): metric name to value mapping
+            step (int): increment
+            phase (str): phase of the experiment
+            timestamp (int): unix time of the values
+            rank (int): rank of the process that traced values
+        """
+        self.__write_frame((names_to_values, step, phase, timestamp, rank))
+        self.__file.flush()
+
+    def sync(self):
+        """Force log content to the disk"""
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    def close(self):
+        self.__file.close()
+
+    @property
+    def committed(self):
+        """Offset of the first record that was not written to the database"""
+        return read_committed(self.path)
+
+    def commit(self, offset):
+        """Mark records before offset as written to the database, the log is truncated
+        when all its records are written
+        """
+        self.__file.flush()
+        if offset > self.__header_end and offset >= os.fstat(self.__file.fileno()).st_size:
+            # offset greater than the size is reset to the header on the next open
+            self.__file.truncate(self.__header_end)
+            offset = self.__header_end
+        offset_path = self.path + '.offset'
+        with open(offset_path + '.tmp', 'w') as f:
+            f.write(str(offset))
+        os.replace(offset_path + '.tmp', offset_path)
+
+    def records(self, offset=None):
+        """Iterate over records of the log
+
+        Args:
+            offset (int): offset to start from, first not committed record by default
+
+        Yields:
+            tuple: offset after the record and tuple of (names_to_values, step, phase,
+                timestamp, rank)
+        """
+        self.__file.flush()
+        return read_records(self.path, self.committed if offset is None else offset)
+
+
+def read_committed(path):
+    """Return offset of the first record of the log that was not written to the database"""
+    try:
+        with open(path + '.offset') as f:
+            return int(f.read())
+    except FileNotFoundError:
+        return 0
+
+
+def iter_frames(path, offset=0):
+    """Iterate over frames of the log with memory mapping
+
+    Frame that was not fully written, e.g. because of a crash, finishes iteration.
+
+    Raises:
+        RarogException: if file is not a rarog log
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(MAGIC):
+            raise RarogException('File `{path}` is not a rarog log'.format(path=path))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:len(MAGIC)] != MAGIC:
+                raise RarogException('File `{path}` is not a rarog log'.format(path=path))
+            for start, end in _frames_bounds(buf, max(offset, len(MAGIC)), size):
+                yield end, pickle.loads(buf[start:end])
+
+
+def log_bounds(path):
+    """Return offsets after the header and after the last complete frame of the log,
+    frames are not unpickled
+
+    Returns:
+        tuple(int, int): offsets, `None` if the log has no complete header
+
+    Raises:
+        RarogException: if file is not a rarog log
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(MAGIC) and MAGIC.startswith(f.read()):
+            # magic bytes or the header were not fully written
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:len(MAGIC)] != MAGIC:
+                raise RarogException('File `{path}` is not a rarog log'.format(path=path))
+            header_end = end = None
+            for _, end in _frames_bounds(buf, len(MAGIC), size):
+                if header_end is None:
+                    header_end = end
+            return None if header_end is None else (header_end, end)
+
+
+def _frames_bounds(buf, offset, size):
+    """Yield start and end of pickles of complete frames starting from offset"""
+    while offset + FRAME_HEADER.size <= size:
+        length, = FRAME_HEADER.unpack_from(buf, offset)
+        end = offset + FRAME_HEADER.size + length
+        if end > size:
+            return
+        yield offset + FRAME_HEADER.size, end
+        offset = end
+
+
+def read_header(path):
+    """Return header of the log"""
+    for _, header in iter_frames(path):
+        return header
+    raise RarogException('Log `{path}` has no header'.format(path=path))
+
+
+def read_records(path, offset=0):
+    """Iterate over records of the log starting from offset, header is skipped"""
+    frames = iter_frames(path, offset)
+    if offset <= len(MAGIC):
+        next(frames, None)
+    return frames
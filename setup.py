@@ -39,5 +39,10 @@ setup(
     packages=["rarog"],
     include_package_data=True,
     python_requires=">=3.4.0",
-    install_requires=["clickhouse-driver", "numpy"]
+    install_requires=["clickhouse-driver", "numpy"],
+    extras_require={
+        "lz4": ["lz4", "clickhouse-cityhash"],
+        "zstd": ["zstd", "clickhouse-cityhash"],
+        "parquet": ["pyarrow", "clickhouse-driver>=0.2.11"],
+    }
 )
@@ -1,4 +1,5 @@
 import os
+import sys
 
 import pytest
 from clickhouse_driver import Client
@@ -15,3 +16,7 @@ def db_port():
 @pytest.fixture()
 def client(db_port):
     return Client(host="localhost", port=db_port)
+
+
+# asyncio interface relies on async/await syntax
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 5) else []
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from rarog import RarogException
+from rarog.aio import AsyncManager, AsyncTracker
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_tracker(client, db_port):
+    async def trace():
+        async with AsyncTracker('test_async_tracker', sync_step=10, port=db_port) as tracker:
+            await tracker.trace('first', 1, step=0)
+            await tracker.multy_trace({'first': 2, 'second': 0.5}, step=1)
+            await tracker.flush()
+            assert sorted(await tracker.metrics()) == ['first', 'phase', 'second', 'step',
+                                                       'time']
+    run(trace())
+    assert client.execute('SELECT count(*) FROM test_async_tracker')[0][0] == 2
+    client.execute('DROP TABLE test_async_tracker')
+
+
+def test_async_tracker_raises_creation_error(client, db_port):
+    client.execute('CREATE TABLE test_async_tracker_exists (step UInt32) ENGINE = Memory()')
+
+    async def trace():
+        tracker = AsyncTracker('test_async_tracker_exists', port=db_port)
+        with pytest.raises(RarogException):
+            await tracker.trace('first', 1, step=0)
+    run(trace())
+    client.execute('DROP TABLE test_async_tracker_exists')
+
+
+def test_async_manager(client, db_port):
+    async def manage():
+        async with AsyncManager(port=db_port) as manager:
+            async with manager.tracker('test_async_manager') as tracker:
+                await tracker.trace('first', 1, step=0)
+            assert await manager.list_experiments() == ['test_async_manager']
+            await manager.remove_experiment('test_async_manager')
+            assert await manager.list_experiments() == []
+    run(manage())
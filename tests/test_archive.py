@@ -0,0 +1,41 @@
+import pytest
+
+from rarog import Manager, RarogException, Tracker
+from rarog.archive import click_type_to_arrow, to_insert_column
+
+pa = pytest.importorskip('pyarrow')
+
+
+def test_click_type_to_arrow():
+    assert click_type_to_arrow('UInt32') == pa.uint32()
+    assert click_type_to_arrow('LowCardinality(String)') == pa.string()
+    assert click_type_to_arrow('Array(Float32)') == pa.list_(pa.float32())
+    assert click_type_to_arrow('DateTime') == pa.timestamp('s')
+    with pytest.raises(RarogException):
+        click_type_to_arrow('Decimal(9, 2)')
+
+
+def test_to_insert_column():
+    assert to_insert_column(pa.array([1, None, 3], pa.int32())) == [1, None, 3]
+    assert to_insert_column(pa.array([0, 10000], pa.timestamp('ms'))) == [0, 10]
+    lists = pa.array([[0.5, 1.5], [], [2.5]], pa.list_(pa.float32()))
+    assert [list(values) for values in to_insert_column(lists.slice(1))] == [[], [2.5]]
+
+
+def test_manager_export_import_experiment(client, db_port, tmpdir):
+    path = str(tmpdir.join('experiment.parquet'))
+    manager = Manager(host='localhost', port=db_port)
+    with Tracker('test_manager_export', sync_step=100, port=db_port) as tracker:
+        for step in range(10):
+            tracker.multy_trace({'int': step, 'list': [0.5, float(step)]}, step=step)
+            if step % 2:
+                tracker.trace('sparse', 0.5, step=step)
+    assert manager.export_experiment('test_manager_export', path, block_rows=3) == 10
+    assert manager.import_experiment(path, 'test_manager_import', block_rows=4) == 10
+    query = 'SELECT time, step, phase, int, list, sparse FROM {} ORDER BY step'
+    assert client.execute(query.format('test_manager_import')) == \
+        client.execute(query.format('test_manager_export'))
+    with pytest.raises(RarogException):
+        manager.import_experiment(path, 'test_manager_import')
+    manager.remove_experiment('test_manager_export')
+    manager.remove_experiment('test_manager_import')
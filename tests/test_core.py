@@ -1,11 +1,18 @@
 import datetime
+import importlib.util
+import subprocess
+import sys
 from functools import partial
 
 import numpy as np
 import pytest
 
-from rarog import RarogException, Manager, Tracker
-from rarog.core import NUMPY_DATATYPE_TO_CLICKHOUSE, python_type_to_click, check_value
+from rarog import RarogException, Histogram, Manager, Tracker
+from rarog.core import (NUMPY_DATATYPE_TO_CLICKHOUSE, TABLE_LAYOUTS, python_type_to_click,
+                        check_value, expand_values, ColumnarBuffer, MetricTypes)
+from rarog.reducers import REDUCERS
+from rarog.samplers import EveryNth, KeepExtremes, Reservoir
+from rarog.wal import read_records
 
 
 # Functions tests
@@ -39,6 +46,153 @@ def test_check_value_incorrect_numpy_shape():
         check_value(np.arange(10).reshape(2, 5))
 
 
+def test_columnar_buffer_batches():
+    buffer = ColumnarBuffer(capacity=2)
+    buffer.append({'first': 1}, step=0, phase='train', timestamp=10)
+    buffer.append({'second': 2.5}, step=0, phase='train', timestamp=11)
+    buffer.append({'first': 3, 'second': 4.5}, step=1, phase='train', timestamp=12)
+    buffer.append({'first': 5}, step=1, phase='val', timestamp=13)
+    assert len(buffer) == 3
+    batches = sorted(buffer.batches(), key=len)
+    assert batches == [
+        {'first': [5], 'step': [1], 'phase': ['val'], 'time': [13]},
+        {'first': [1, 3], 'second': [2.5, 4.5], 'step': [0, 1], 'phase': ['train', 'train'],
+         'time': [11, 12]},
+    ]
+    buffer.clear()
+    assert not len(buffer) and not buffer.batches()
+
+
+def test_columnar_buffer_rejected_value_leaves_no_row():
+    buffer = ColumnarBuffer(capacity=2, metric_types=MetricTypes())
+    buffer.append({'first': 1}, step=0, phase='train', timestamp=0)
+    with pytest.raises(RarogException):
+        buffer.append({'second': 2, 'first': 'string'}, step=1, phase='train', timestamp=0)
+    assert len(buffer) == 1
+    assert [batch['step'] for batch in buffer.batches()] == [[0]]
+
+
+def test_columnar_buffer_ranks():
+    buffer = ColumnarBuffer()
+    buffer.append({'first': 1}, step=0, phase='train', timestamp=0, rank=0)
+    buffer.append({'first': 2}, step=0, phase='train', timestamp=0, rank=1)
+    buffer.append({'first': 3}, step=0, phase='train', timestamp=0)
+    batches = sorted(buffer.batches(), key=len)
+    assert batches[0]['first'] == [3] and 'rank' not in batches[0]
+    assert batches[1]['first'] == [1, 2] and batches[1]['rank'] == [0, 1]
+
+
+def test_columnar_buffer_reducers():
+    buffer = ColumnarBuffer(reducers={'first': REDUCERS['mean']})
+    for value in range(4):
+        buffer.append({'first': value, 'second': value}, step=0, phase='train', timestamp=0)
+    batch, = buffer.batches()
+    assert batch['first'] == [1.5]
+    assert batch['second'] == [3]
+
+
+def test_columnar_buffer_held_step():
+    buffer = ColumnarBuffer(reducers={'first': REDUCERS['mean']})
+    buffer.append({'first': 1, 'second': 'a'}, step=0, phase='train', timestamp=0)
+    buffer.append({'first': 2}, step=1, phase='train', timestamp=0)
+    buffer.append({'first': 4}, step=1, phase='val', timestamp=0)
+    assert [batch['step'] for batch in buffer.batches(held_step=1)] == [[0]]
+    buffer.clear(held_step=1)
+    assert len(buffer) == 2 and buffer.nbytes == 8 + len('train') + 8 + len('val')
+    buffer.append({'first': 4}, step=1, phase='train', timestamp=0)
+    batch, = buffer.batches()
+    assert batch['first'] == [3.0, 4.0] and batch['phase'] == ['train', 'val']
+
+
+def test_columnar_buffer_mixed_types():
+    buffer = ColumnarBuffer()
+    buffer.append({'value': 1}, step=0, phase='train', timestamp=0)
+    buffer.append({'value': 'string'}, step=1, phase='train', timestamp=0)
+    assert buffer.batches()[0]['value'] == [1, 'string']
+
+
+def test_metric_types_cache():
+    metric_types = MetricTypes()
+    metric_types.check('list', [1, 2, 3])
+    metric_types.check('array', np.arange(3, dtype=np.float32))
+    metric_types.check('float', 0.5)
+    assert metric_types.get('list') == 'Array(Int32)'
+    assert metric_types.get('array') == 'Array(Float32)'
+    assert metric_types.get('float') == 'Float32'
+    metric_types.check('list', [4, 5])
+    metric_types.check('array', np.arange(5, dtype=np.float32))
+    # numeric values are accepted by float columns
+    metric_types.check('float', 1)
+    # booleans are accepted by numeric columns
+    metric_types.check('int', 1)
+    metric_types.check('int', True)
+    metric_types.check('float', False)
+    metric_types.check('strings', ['a', 'b'])
+    metric_types.check('strings', ['abc'])
+    assert metric_types.get('strings') == 'Array(String)'
+
+
+@pytest.mark.parametrize('name, value', [
+    ('list', [1, 2.5]),
+    ('list', [1.5, 2.5]),
+    # every element is checked, not only a sample of them
+    ('list', [1] * 50 + ['oops'] + [1] * 49),
+    ('list', [[1], [2, 3]]),
+    ('strings', ['a', 1]),
+    ('array', 0.5),
+    ('float', 'string'),
+])
+def test_metric_types_detects_type_change(name, value):
+    metric_types = MetricTypes()
+    metric_types.check('list', [1, 2, 3])
+    metric_types.check('array', np.arange(3, dtype=np.float32))
+    metric_types.check('float', 0.5)
+    metric_types.check('strings', ['a', 'b'])
+    with pytest.raises((RarogException, NotImplementedError)):
+        metric_types.check(name, value)
+    with pytest.raises(NotImplementedError):
+        metric_types.check('array', np.arange(4, dtype=np.float32).reshape(2, 2))
+
+
+class FakeTensor:
+    """Object with the interface of the pytorch tensor"""
+
+    def __init__(self, array):
+        self.array = array
+
+    def detach(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+def test_expand_values():
+    weights = np.arange(6, dtype=np.float32).reshape(2, 3)
+    values = {'loss': 0.5, 'weights': FakeTensor(weights), 'scalar': FakeTensor(np.array(2.5))}
+    expanded = expand_values(values)
+    assert sorted(expanded) == ['loss', 'scalar', 'weights', 'weights__shape']
+    assert expanded['scalar'] == 2.5
+    np.testing.assert_array_equal(expanded['weights'], np.arange(6))
+    np.testing.assert_array_equal(expanded['weights__shape'], [2, 3])
+    # arrays are copied, so tensor may be changed in place after it was traced
+    assert not np.shares_memory(expanded['weights'], weights)
+    plain = {'loss': 0.5, 'array': np.arange(3)}
+    assert expand_values(plain) is plain
+
+
+def test_histogram():
+    histogram = Histogram(np.arange(1000).reshape(10, 100), bins=10)
+    np.testing.assert_array_equal(histogram.counts, [100] * 10)
+    assert len(histogram.edges) == 11
+    expanded = expand_values({'weights': histogram})
+    assert sorted(expanded) == ['weights__counts', 'weights__edges']
+    assert python_type_to_click(expanded['weights__counts']) == 'Array(UInt64)'
+
+
 # Manager tests
 @pytest.fixture
 def manager(db_port):
@@ -81,6 +235,44 @@ def test_manager_remove_experiment_failed(client, manager):
         manager.remove_experiment("test_manager_remove_experiment_failed")
 
 
+def test_manager_compare(client, manager, db_port):
+    for idx, storage in enumerate(['wide', 'narrow', 'wide']):
+        tracker = Tracker('test_manager_compare_{}'.format(idx), port=db_port,
+                          sync_step=1000, storage=storage)
+        for step in range(100):
+            tracker.trace('loss', float(idx + 100 - step), step=step)
+            tracker.trace('loss', 0.0, step=step, phase='val')
+        # rows without the metric are not compared
+        tracker.trace('lr', 0.1, step=100)
+        tracker.close()
+    values = manager.compare(['test_manager_compare_1', 'test_manager_compare_0'], 'loss',
+                             phase='train', step_buckets=10)
+    assert list(values['experiment']) == ['test_manager_compare_1', 'test_manager_compare_0']
+    np.testing.assert_array_equal(values['step'], np.arange(0, 100, 10))
+    assert values['values'].shape == (2, 10)
+    np.testing.assert_allclose(values['values'][1], 100 - np.arange(0, 100, 10) - 4.5)
+    np.testing.assert_allclose(values['summary'], [2, 1])
+    values = manager.compare('^test_manager_compare_', 'loss', phase='train', summary='max')
+    assert values['values'].shape == (3, 100)
+    np.testing.assert_allclose(values['summary'], [100, 101, 102])
+    values = manager.compare('^test_manager_compare_', 'loss', phase='train', summary='min')
+    np.testing.assert_allclose(values['summary'], [1, 2, 3])
+    with pytest.raises(RarogException):
+        manager.compare(['test_manager_compare_0', 'unknown'], 'loss')
+    with pytest.raises(RarogException):
+        manager.compare(['test_manager_compare_0'], 'unknown')
+    with pytest.raises(RarogException):
+        manager.compare(['test_manager_compare_0'], 'loss', agg='median')
+    for idx in range(3):
+        manager.remove_experiment('test_manager_compare_{}'.format(idx))
+
+
+@pytest.mark.skipif(importlib.util.find_spec('lz4') is not None, reason='lz4 is installed')
+def test_manager_compression_requires_library(db_port):
+    with pytest.raises(RarogException):
+        Manager(host='localhost', port=db_port, compression='lz4')
+
+
 # Tracker tests
 @pytest.fixture
 def partial_tracker(db_port):
@@ -108,6 +300,33 @@ def test_tracker__init__not_raises_exception(client, partial_tracker):
     client.execute('DROP TABLE test_tracker__init__not_raises_exception')
 
 
+def test_tracker_lazy(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_lazy', lazy=True)
+    assert ('test_tracker_lazy',) not in client.execute('SHOW TABLES')
+    tracker.trace('value', 1, step=0)
+    assert client.execute('SELECT count(*) FROM test_tracker_lazy')[0][0] == 1
+    # table is checked once per process
+    partial_tracker('test_tracker_lazy', exist_ok=True).trace('value', 2, step=1)
+    assert client.execute('SELECT count(*) FROM test_tracker_lazy')[0][0] == 2
+    client.execute('DROP TABLE test_tracker_lazy')
+
+
+def test_tracker_lazy_raises_on_first_use(client, partial_tracker):
+    client.execute('CREATE TABLE test_tracker_lazy_failed (step UInt32) ENGINE = Memory()')
+    tracker = partial_tracker(name='test_tracker_lazy_failed', lazy=True)
+    with pytest.raises(RarogException):
+        tracker.trace('value', 1, step=0)
+    client.execute('DROP TABLE test_tracker_lazy_failed')
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='requires module __getattr__')
+def test_lazy_imports():
+    code = (
+        'import sys, rarog; rarog.Tracker("test_lazy_imports", lazy=True, sync_step=10); '
+        'print(any(name in sys.modules for name in ("numpy", "clickhouse_driver")))')
+    assert subprocess.check_output([sys.executable, '-c', code]).strip() == b'False'
+
+
 def test_tracker__repr__(client, partial_tracker):
     tracker = partial_tracker('test_tracker__repr__')
     assert str(tracker) == 'Tracker:test_tracker__repr__'
@@ -170,10 +389,7 @@ def test_tracker__write_batch_of_metrics(client, partial_tracker):
     tracker = partial_tracker('test_tracker__write_batch_of_metrics')
     assert client.execute('SELECT count(*) from test_tracker__write_batch_of_metrics')[0][0] == 0
     tracker._Tracker__write_batch_of_metrics(
-        'first,step,phase', [
-            {'first': 1, 'step': 42, 'phase': 'val'},
-            {'first': 1, 'step': 42, 'phase': 'train'}]
-    )
+        {'first': [1, 1], 'step': [42, 42], 'phase': ['val', 'train']})
     assert client.execute('SELECT count(*) from test_tracker__write_batch_of_metrics')[0][0] == 2
     client.execute('DROP TABLE test_tracker__write_batch_of_metrics')
 
@@ -206,6 +422,115 @@ def test__add_column_various_values(value, client, partial_tracker):
     client.execute('DROP TABLE {table_name}'.format(table_name=tracker_name))
 
 
+def test__add_columns(client, partial_tracker):
+    tracker = partial_tracker('test__add_columns')
+    tracker._Tracker__add_columns({'first': 1, 'second': 2.5, 'third': [1, 2]})
+    assert sorted(tracker.metrics) == ['first', 'phase', 'second', 'step', 'third', 'time']
+    client.execute('DROP TABLE test__add_columns')
+
+
+def test_tracker_write_batch_of_metrics_outdated_schema(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_outdated_schema', sync_step=10)
+    tracker.trace('first', 1, step=1)
+    tracker.flush()
+    client.execute('DROP TABLE test_tracker_outdated_schema')
+    client.execute('CREATE TABLE test_tracker_outdated_schema (step UInt32, phase String, '
+                   'time DateTime) ENGINE = Memory()')
+    tracker.trace('first', 1, step=2)
+    tracker.flush()
+    assert client.execute('SELECT count(*) from test_tracker_outdated_schema')[0][0] == 1
+    client.execute('DROP TABLE test_tracker_outdated_schema')
+
+
+def test_tracker_ranked(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_ranked', sync_step=10, ranked=True)
+    tracker.trace('first', 1, step=1, rank=0)
+    tracker.trace('first', 2, step=1, rank=1)
+    tracker.flush()
+    assert client.execute('SELECT count(*) from test_tracker_ranked')[0][0] == 2
+    client.execute('DROP TABLE test_tracker_ranked')
+
+
+@pytest.mark.parametrize('sync_step', [0, 10])
+def test_tracker_reducers(sync_step, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_reducers', sync_step=sync_step,
+                              reducers={'first': 'mean', 'second': 'max'})
+    for step in range(3):
+        for value in range(4):
+            tracker.multy_trace({'first': float(value), 'second': value}, step=step)
+    tracker.flush()
+    assert client.execute('SELECT first, second from test_tracker_reducers ORDER BY step') == \
+        [(1.5, 3)] * 3
+    client.execute('DROP TABLE test_tracker_reducers')
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'sync_step': 1000, 'max_buffer_rows': 1},
+    {'wal_path': 'log'},
+])
+def test_tracker_reducers_early_sync(kwargs, client, partial_tracker, tmpdir):
+    if 'wal_path' in kwargs:
+        kwargs['wal_path'] = str(tmpdir.join(kwargs['wal_path']))
+    tracker = partial_tracker('test_tracker_reducers_early_sync', reducers={'first': 'mean'},
+                              **kwargs)
+    for value in [1, 3, 10, 30]:
+        tracker.trace('first', float(value), step=5)
+    # values of the traced step are kept by syncs
+    assert client.execute('SELECT count(*) from test_tracker_reducers_early_sync')[0][0] == 0
+    tracker.trace('first', 1.0, step=6)
+    assert client.execute('SELECT step, first from test_tracker_reducers_early_sync') == \
+        [(5, 11.0)]
+    tracker.close()
+    client.execute('DROP TABLE test_tracker_reducers_early_sync')
+
+
+def test_tracker_unknown_reducer(partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_unknown_reducer', reducers={'first': 'median'})
+
+
+@pytest.mark.parametrize('sync_step', [0, 100])
+def test_tracker_samplers(sync_step, client, partial_tracker):
+    tracker = partial_tracker(
+        'test_tracker_samplers', sync_step=sync_step,
+        samplers={'loss': KeepExtremes(EveryNth(10), window=10)})
+    for step in range(20):
+        tracker.multy_trace({'loss': 100.0 if step == 13 else 1.0, 'lr': 0.1}, step=step)
+    tracker.flush()
+    # extremes of the window are held until the window ends, flush doesn't cut it
+    assert client.execute(
+        'SELECT step FROM test_tracker_samplers WHERE loss > 0 ORDER BY step') == [(0,), (10,)]
+    assert client.execute('SELECT count(DISTINCT step) FROM test_tracker_samplers')[0][0] == 20
+    assert tracker.stats()['sampled_out'] == 18
+    tracker.close()
+    assert client.execute(
+        'SELECT step FROM test_tracker_samplers WHERE loss > 0 ORDER BY step') == \
+        [(0,), (10,), (13,)]
+    assert tracker.stats()['sampled_out'] == 17
+    client.execute('DROP TABLE test_tracker_samplers')
+
+
+def test_tracker_unknown_sampler(partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_unknown_sampler', samplers={'loss': 'every_10'})
+
+
+def test_tracker_codecs(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_codecs', codecs=True)
+    tracker.multy_trace({'int': 1, 'float': 0.5, 'list': [0.5, 1.5]}, step=0)
+    columns = dict(
+        (name, (data_type, codec)) for name, data_type, codec in client.execute(
+            "SELECT name, type, compression_codec FROM system.columns "
+            "WHERE table = 'test_tracker_codecs'"))
+    assert columns['step'] == ('UInt32', 'CODEC(DoubleDelta, LZ4)')
+    assert columns['phase'][0] == 'LowCardinality(String)'
+    assert columns['int'] == ('Nullable(Int32)', '')
+    assert columns['float'] == ('Nullable(Float32)', 'CODEC(Gorilla, LZ4)')
+    assert columns['list'] == ('Array(Float32)', 'CODEC(ZSTD(1))')
+    assert client.execute('SELECT count(*) FROM test_tracker_codecs')[0][0] == 1
+    client.execute('DROP TABLE test_tracker_codecs')
+
+
 def test_tracker_trace(client, partial_tracker):
     tracker = partial_tracker('test_tracker_trace')
     assert client.execute('SELECT count(*) from test_tracker_trace')[0][0] == 0
@@ -224,13 +549,385 @@ def test_tracker_multy_trace(client, partial_tracker):
 
 def test_tracker_sync_accumulated_values(client, partial_tracker, db_port):
     tracker = partial_tracker('test_tracker_sync_accumulated_values', sync_step=1)
-    tracker._Tracker__upload_values = {
-        1: {
-            'train': {'value': 42}
-        },
-        2: {
-            'train': {'value': 43}
-        }
-    }
+    tracker._Tracker__upload_values.append({'value': 42}, step=1, phase='train', timestamp=0)
+    tracker._Tracker__upload_values.append({'value': 43}, step=2, phase='train', timestamp=0)
     tracker.sync_accumulated_values()
+    assert client.execute('SELECT count(*) from test_tracker_sync_accumulated_values')[0][0] == 2
     client.execute('DROP TABLE test_tracker_sync_accumulated_values')
+
+
+def test_tracker_async_flush(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_async_flush', async_flush=True)
+    tracker.trace('first', 1, step=1)
+    tracker.multy_trace({'first': 2, 'second': 3}, step=2)
+    tracker.flush()
+    assert client.execute('SELECT count(*) from test_tracker_async_flush')[0][0] == 2
+    tracker.close()
+    with pytest.raises(RarogException):
+        tracker.trace('first', 1, step=3)
+    client.execute('DROP TABLE test_tracker_async_flush')
+
+
+def test_tracker_async_flush_batch_context_manager(client, partial_tracker):
+    with partial_tracker('test_tracker_async_flush_batch', sync_step=100,
+                         async_flush=True) as tracker:
+        for step in range(10):
+            tracker.trace('first', step, step=step)
+        assert client.execute('SELECT count(*) from test_tracker_async_flush_batch')[0][0] == 0
+    assert client.execute('SELECT count(*) from test_tracker_async_flush_batch')[0][0] == 10
+    client.execute('DROP TABLE test_tracker_async_flush_batch')
+
+
+def test_tracker_max_buffer_rows(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_max_buffer_rows', sync_step=1000, max_buffer_rows=2)
+    tracker.trace('first', 1, step=1)
+    assert client.execute('SELECT count(*) from test_tracker_max_buffer_rows')[0][0] == 0
+    tracker.trace('first', 1, step=2)
+    assert client.execute('SELECT count(*) from test_tracker_max_buffer_rows')[0][0] == 2
+    client.execute('DROP TABLE test_tracker_max_buffer_rows')
+
+
+def test_tracker_stats(client, partial_tracker):
+    flushes, schema_changes = [], []
+    tracker = partial_tracker('test_tracker_stats', sync_step=1000,
+                              on_flush=flushes.append, on_schema_change=schema_changes.append)
+    tracker.multy_trace({'first': 1, 'second': 0.5}, step=1)
+    tracker.trace('first', 2, step=2)
+    stats = tracker.stats()
+    assert stats['buffered_rows'] == 2
+    assert stats['buffered_bytes'] > 0
+    assert stats['flushes'] == 0
+    tracker.flush()
+    stats = tracker.stats()
+    assert stats['buffered_rows'] == 0
+    assert stats['flushes'] == 1
+    assert stats['inserts'] == 2
+    assert stats['rows_sent'] == 2
+    assert stats['schema_changes'] == len(schema_changes)
+    assert len(flushes) == 1
+    assert flushes[0]['rows'] == 2 and flushes[0]['error'] is None
+    added_columns = {}
+    for names_to_types in schema_changes:
+        added_columns.update(names_to_types)
+    assert added_columns == {'first': 'Int32', 'second': 'Float32'}
+    client.execute('DROP TABLE test_tracker_stats')
+
+
+def test_tracker_spill_dir(client, partial_tracker, tmpdir):
+    tracker = partial_tracker('test_tracker_spill_dir', sync_step=1000, max_buffer_bytes=1,
+                              spill_dir=str(tmpdir))
+    tracker.trace('first', 1, step=1)
+    tracker.trace('first', 2, step=2)
+    # database is available, so values are written instead of spilled
+    assert not tmpdir.listdir()
+    assert client.execute('SELECT count(*) from test_tracker_spill_dir')[0][0] == 2
+    client.execute('DROP TABLE test_tracker_spill_dir')
+
+
+def test_tracker_spill_dir_connection_error(tmpdir):
+    tracker = Tracker('test_tracker_spill_dir_connection_error', host='localhost', port=1,
+                      lazy=True, sync_step=1000, max_buffer_rows=1, spill_dir=str(tmpdir))
+    tracker.trace('first', 1, step=1)
+    tracker.trace('first', 2, step=2)
+    assert len(tmpdir.listdir()) == 2
+    assert tracker.stats()['connection_errors'] == 2
+
+
+def test_tracker_wal_path(client, partial_tracker, tmpdir):
+    log_path = str(tmpdir.join('log'))
+    tracker = partial_tracker('test_tracker_wal_path', sync_step=2, wal_path=log_path)
+    tracker.trace('first', 1, step=0)
+    assert client.execute('SELECT count(*) from test_tracker_wal_path')[0][0] == 0
+    tracker.trace('first', 1, step=2)
+    assert client.execute('SELECT count(*) from test_tracker_wal_path')[0][0] == 2
+    tracker.trace('first', 1, step=3)
+    tracker.close()
+    assert client.execute('SELECT count(*) from test_tracker_wal_path')[0][0] == 3
+    client.execute('DROP TABLE test_tracker_wal_path')
+
+
+def test_tracker_wal_path_connection_error(tmpdir):
+    log_path = str(tmpdir.join('log'))
+    tracker = Tracker('test_tracker_wal_path_connection_error', host='localhost', port=1,
+                      wal_path=log_path, sync_step=10)
+    tracker.trace('first', 1, step=0)
+    tracker.flush()
+    tracker.close()
+    assert tracker.stats()['connection_errors'] == 3
+    assert [record[1] for _, record in read_records(log_path)] == [0]
+    with pytest.raises(RarogException):
+        Manager(port=1).replay_log(log_path, remove=True)
+    assert tmpdir.join('log').exists()
+
+
+@pytest.mark.parametrize('storage', ['wide', 'narrow'])
+def test_tracker_offline_replay_log(storage, client, partial_tracker, manager, tmpdir):
+    log_path = str(tmpdir.join('log'))
+    with partial_tracker('test_tracker_offline', wal_path=log_path, offline=True,
+                         storage=storage, layout='replacing', sync_step=100) as tracker:
+        tracker.multy_trace({'first': 1, 'second': 2.5}, step=0)
+        tracker.multy_trace({'first': 1, 'second': 2.5}, step=1)
+    assert 'test_tracker_offline' not in manager.list_experiments()
+    manager.replay_log(log_path, remove=True)
+    assert client.execute('SELECT count(*) from test_tracker_offline')[0][0] == 2 * (
+        1 if storage == 'wide' else 2)
+    # table is created with storage and layout of the offline tracker
+    engine, = client.execute(
+        "SELECT engine FROM system.tables WHERE name = 'test_tracker_offline'")[0]
+    assert engine == 'ReplacingMergeTree'
+    assert ('metric' in {column[0] for column in client.execute(
+        'DESCRIBE TABLE test_tracker_offline')}) == (storage == 'narrow')
+    assert not tmpdir.listdir()
+    client.execute('DROP TABLE test_tracker_offline')
+
+
+def test_tracker_offline_requires_wal_path(partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_offline_requires_wal_path', offline=True)
+
+
+@pytest.mark.parametrize('storage', ['wide', 'narrow'])
+def test_tracker_read(storage, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_read', sync_step=100, storage=storage)
+    for step in range(10):
+        tracker.multy_trace({'first': step, 'second': [step, step]}, step=step)
+        tracker.trace('first', -step, step=step, phase='val')
+    tracker.flush()
+    values = tracker.read(['first', 'second'], phase='train', step_range=(2, 5))
+    np.testing.assert_array_equal(values['step'], [2, 3, 4, 5])
+    np.testing.assert_array_equal(values['first'], [2, 3, 4, 5])
+    assert list(values['second'][0]) == [2, 2]
+    assert len(tracker.read('first')['first']) == 20
+    with pytest.raises(RarogException):
+        tracker.read('unknown')
+    client.execute('DROP TABLE test_tracker_read')
+
+
+@pytest.mark.parametrize('storage', ['wide', 'narrow'])
+def test_tracker_tensors(storage, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_tensors', sync_step=100, storage=storage)
+    for step in range(3):
+        attention = np.full((2, 3), step, dtype=np.float32)
+        tracker.trace('attention', FakeTensor(attention), step=step)
+        tracker.trace('weights', Histogram(np.arange(100) + step, bins=4), step=step)
+    tracker.flush()
+    assert set(tracker.metrics) >= {
+        'attention', 'attention__shape', 'weights__counts', 'weights__edges'}
+    values = tracker.read('attention')
+    assert sorted(values) == ['attention', 'phase', 'step']
+    assert values['attention'][2].shape == (2, 3)
+    np.testing.assert_array_equal(values['attention'][2], np.full((2, 3), 2))
+    counts = tracker.read('weights__counts')['weights__counts']
+    assert list(counts[0]) == [25, 25, 25, 25]
+    client.execute('DROP TABLE test_tracker_tensors')
+
+
+@pytest.mark.parametrize('sampler', [None, Reservoir(size=3, window=3)])
+def test_tracker_tensor_changed_in_place(sampler, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_tensor_changed_in_place', sync_step=100,
+                              samplers={'weights': sampler, 'plain': sampler} if sampler else None)
+    weights = np.zeros(4, dtype=np.float32)
+    for step in range(3):
+        weights[:] = step
+        tracker.trace('weights', FakeTensor(weights), step=step)
+        tracker.trace('plain', weights, step=step)
+    weights[:] = 3
+    tracker.close()
+    for name in ['weights', 'plain']:
+        values = tracker.read(name)
+        assert [list(row) for row in values[name]] == [[step] * 4 for step in range(3)]
+    client.execute('DROP TABLE test_tracker_tensor_changed_in_place')
+
+
+@pytest.mark.parametrize('storage', ['wide', 'narrow'])
+def test_tracker_read_max_points(storage, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_read_max_points', sync_step=100, storage=storage)
+    for step in range(100):
+        tracker.trace('first', float(step), step=step)
+    tracker.flush()
+    values = tracker.read('first', max_points=10)
+    np.testing.assert_array_equal(values['step'], np.arange(0, 100, 10))
+    np.testing.assert_allclose(values['first'], np.arange(0, 100, 10) + 4.5)
+    client.execute('DROP TABLE test_tracker_read_max_points')
+
+
+def test_tracker_read_max_points_first_step(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_read_max_points_first_step', sync_step=100)
+    for step in range(1, 101):
+        tracker.trace('first', float(step), step=step)
+    tracker.flush()
+    # buckets start from the first step, so there are no extra buckets
+    values = tracker.read('first', max_points=10)
+    np.testing.assert_array_equal(values['step'], np.arange(1, 101, 10))
+    values = tracker.read('first', step_range=(5, 14), max_points=5)
+    np.testing.assert_array_equal(values['step'], np.arange(5, 15, 2))
+    np.testing.assert_allclose(values['first'], np.arange(5, 15, 2) + 0.5)
+    client.execute('DROP TABLE test_tracker_read_max_points_first_step')
+
+
+@pytest.mark.parametrize('storage', ['wide', 'narrow'])
+def test_tracker_read_sparse_metrics(storage, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_read_sparse_metrics', storage=storage)
+    tracker.trace('loss', 0.5, step=0)
+    tracker.trace('acc', 0.9, step=0)
+    tracker.trace('loss', 0.4, step=1)
+    tracker.trace('loss', 0.3, step=1, phase='val')
+    # rows traced without the metric are not read as zeros
+    values = tracker.read('loss', phase='train')
+    np.testing.assert_array_equal(values['step'], [0, 1])
+    np.testing.assert_allclose(values['loss'], [0.5, 0.4])
+    values = tracker.read('acc')
+    np.testing.assert_array_equal(values['step'], [0])
+    np.testing.assert_allclose(values['acc'], [0.9])
+    values = tracker.read('acc', max_points=10)
+    np.testing.assert_allclose(values['acc'], [0.9])
+    values = tracker.read(['loss', 'acc'], phase='train', max_points=10)
+    np.testing.assert_array_equal(values['step'], [0, 1])
+    np.testing.assert_allclose(values['loss'], [0.5, 0.4])
+    np.testing.assert_allclose(values['acc'], [0.9, np.nan])
+    values = tracker.read(['loss', 'acc'])
+    assert 0 not in values['acc']
+    assert np.isnan(values['acc']).sum() == len(values['acc']) - 1
+    client.execute('DROP TABLE test_tracker_read_sparse_metrics')
+
+
+@pytest.mark.parametrize('storage', ['wide', 'narrow'])
+def test_tracker_follow(storage, client, partial_tracker, manager):
+    tracker = partial_tracker('test_tracker_follow', storage=storage)
+    for step in range(5):
+        tracker.trace('first', float(step), step=step)
+    stream = tracker.follow('first', since_step=1, poll_interval=0.01, chunk_size=2)
+    chunk = next(stream)
+    np.testing.assert_array_equal(chunk['step'], [1, 2])
+    np.testing.assert_array_equal(chunk['first'], [1, 2])
+    assert chunk['time'].dtype == np.uint32
+    # tracker is used while the stream is between chunks
+    tracker.trace('first', 5.0, step=5)
+    np.testing.assert_array_equal(next(stream)['step'], [3, 4])
+    np.testing.assert_array_equal(next(stream)['step'], [5])
+    # new row of the cursor step is yielded, rows of smaller steps are not
+    tracker.trace('first', 5.5, step=5, phase='valid')
+    tracker.trace('first', 2.5, step=2, phase='valid')
+    chunk = next(stream)
+    np.testing.assert_array_equal(chunk['step'], [5])
+    np.testing.assert_array_equal(chunk['phase'], ['valid'])
+    tracker.trace('first', 6.0, step=6)
+    np.testing.assert_array_equal(next(stream)['step'], [6])
+    stream.close()
+    chunk = next(manager.follow('test_tracker_follow', 'first', chunk_size=2))
+    np.testing.assert_array_equal(chunk['step'], [0, 1])
+    with pytest.raises(RarogException):
+        next(manager.follow('test_tracker_follow_unknown', 'first'))
+    client.execute('DROP TABLE test_tracker_follow')
+
+
+def test_tracker_narrow_storage(client, partial_tracker):
+    tracker = partial_tracker('test_tracker_narrow_storage', storage='narrow')
+    tracker.multy_trace({'int': 1, 'float': 0.5, 'string': 'value', 'list': [1, 2]}, step=0)
+    tracker.trace('float', 1.5, step=1)
+    columns = client.execute('DESCRIBE TABLE test_tracker_narrow_storage')
+    assert 'float' not in [column[0] for column in columns]
+    assert sorted(tracker.metrics) == ['float', 'int', 'list', 'phase', 'step', 'string', 'time']
+    assert client.execute(
+        "SELECT value_float FROM test_tracker_narrow_storage WHERE metric = 'float' "
+        "ORDER BY step") == [(0.5,), (1.5,)]
+    values = tracker.read(['int', 'string', 'list'])
+    assert values['int'].dtype == np.int32
+    assert list(values['string']) == ['value']
+    assert list(values['list'][0]) == [1, 2]
+    client.execute('DROP TABLE test_tracker_narrow_storage')
+
+
+@pytest.mark.parametrize('layout', sorted(TABLE_LAYOUTS))
+def test_tracker_layouts(layout, client, partial_tracker):
+    tracker = partial_tracker('test_tracker_layouts', layout=layout, sync_step=100)
+    tracker.multy_trace({'first': 1, 'second': 0.5}, step=0)
+    tracker.flush()
+    # value traced again for the same step
+    tracker.trace('first', 2, step=0)
+    tracker.flush()
+    values = tracker.read('first')
+    if layout == 'summing':
+        assert list(values['first']) in ([3], [1, 2])
+    elif layout.startswith('replacing'):
+        assert list(values['first']) == [2]
+    else:
+        assert list(values['first']) == [1, 2]
+    client.execute('DROP TABLE test_tracker_layouts')
+
+
+def test_tracker_layout_ttl_sample(client, partial_tracker):
+    partial_tracker('test_tracker_layout_ttl_sample', layout='replacing', ttl_days=30,
+                    sample=True, sync_step=100)
+    create_query = client.execute('SHOW CREATE TABLE test_tracker_layout_ttl_sample')[0][0]
+    assert 'SAMPLE BY intHash32(step)' in create_query
+    assert 'TTL time + toIntervalDay(30)' in create_query
+    client.execute('DROP TABLE test_tracker_layout_ttl_sample')
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_layout_ttl_sample', layout='memory', ttl_days=30)
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_layout_ttl_sample', layout='unknown')
+
+
+def test_tracker_replacing_layout_requires_batching(partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_replacing_layout_requires_batching', layout='replacing')
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_replacing_layout_requires_batching',
+                        layout='replacing_unpartitioned')
+
+
+def test_tracker_replacing_layout_rollups(partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_replacing_layout_rollups', layout='replacing',
+                        sync_step=100, rollups=(10,))
+
+
+@pytest.mark.parametrize('sampler', [Reservoir(2, 10), KeepExtremes(EveryNth(10), 10)])
+def test_tracker_replacing_layout_held_samplers(sampler, partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_replacing_layout_held_samplers', layout='replacing',
+                        sync_step=100, samplers={'loss': sampler})
+
+
+def test_tracker_narrow_storage_errors(partial_tracker):
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_narrow_storage_errors', storage='unknown')
+    with pytest.raises(RarogException):
+        partial_tracker('test_tracker_narrow_storage_errors', storage='narrow', rollups=(10,))
+
+
+def test_tracker_rollups(client, partial_tracker, manager):
+    tracker = partial_tracker('test_tracker_rollups', sync_step=1000, rollups=(10, 100))
+    for step in range(1000):
+        tracker.multy_trace({'first': float(step), 'second': step}, step=step)
+    tracker.flush()
+    assert manager.list_experiments() == ['test_tracker_rollups']
+    assert client.execute('SELECT sum(row_count) from test_tracker_rollups__rollup_10')[0][0] == \
+        1000
+    values = tracker.read(['first', 'second'], max_points=50)
+    np.testing.assert_array_equal(values['step'], np.arange(0, 1000, 20))
+    np.testing.assert_allclose(values['first'], np.arange(0, 1000, 20) + 9.5)
+    values = tracker.read('first', max_points=5, aggregate='max')
+    np.testing.assert_allclose(values['first'], np.arange(0, 1000, 200) + 199)
+    # metric traced for a part of rows is not diluted by rows without it
+    for step in range(1000, 2000):
+        values = {'first': float(step)}
+        if step % 2:
+            values['sparse'] = float(step)
+        tracker.multy_trace(values, step=step)
+    tracker.flush()
+    for aggregate, expected in [('avg', 100), ('min', 1), ('max', 199)]:
+        values = tracker.read('sparse', step_range=(1000, 1999), max_points=5,
+                              aggregate=aggregate)
+        np.testing.assert_allclose(values['sparse'], np.arange(1000, 2000, 200) + expected)
+    values = tracker.read('sparse', step_range=(1000, 1999), max_points=500, aggregate='min')
+    np.testing.assert_allclose(values['sparse'], np.arange(1001, 2000, 2))
+    # buckets without values of a metric are skipped or read as nan
+    values = tracker.read('sparse', max_points=2)
+    np.testing.assert_array_equal(values['step'], [1000, 1500])
+    values = tracker.read(['first', 'sparse'], max_points=2)
+    np.testing.assert_array_equal(values['step'], [0, 1000])
+    np.testing.assert_allclose(values['sparse'], [np.nan, 1500])
+    manager.remove_experiment('test_tracker_rollups')
+    assert not client.execute('SHOW TABLES')
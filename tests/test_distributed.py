@@ -0,0 +1,24 @@
+from rarog.distributed import TrackerServer, RemoteTracker
+
+
+def test_tracker_server_merges_ranks(client, db_port):
+    with TrackerServer('test_tracker_server', host='localhost', port=db_port) as server:
+        trackers = [
+            RemoteTracker(server.address, rank=rank, authkey=server.authkey, send_every=3)
+            for rank in range(3)]
+        for step in range(10):
+            for tracker in trackers:
+                tracker.multy_trace({'first': 1, 'second': 2.5}, step=step)
+        for tracker in trackers:
+            tracker.close()
+    assert client.execute('SELECT count(*) from test_tracker_server')[0][0] == 30
+    assert client.execute(
+        'SELECT DISTINCT rank from test_tracker_server ORDER BY rank') == [(0,), (1,), (2,)]
+    client.execute('DROP TABLE test_tracker_server')
+
+
+def test_tracker_server_random_authkey():
+    first = TrackerServer('test_tracker_server_authkey')
+    second = TrackerServer('test_tracker_server_authkey')
+    assert len(first.authkey) == 32
+    assert first.authkey != second.authkey
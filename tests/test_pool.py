@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from rarog import Manager, RarogException
+from rarog.pool import ConnectionPool
+
+
+def test_connection_pool_reuses_connections():
+    pool = ConnectionPool(size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert pool.created == 1
+
+
+def test_connection_pool_size():
+    pool = ConnectionPool(size=2, timeout=0.01)
+    with pool.connection() as first, pool.connection() as second:
+        assert first is not second
+        with pytest.raises(RarogException):
+            with pool.connection():
+                pass
+    assert pool.created == 2
+
+
+def test_connection_pool_waits_for_free_connection():
+    pool = ConnectionPool(size=1)
+    with pool.connection() as first:
+        borrowed = []
+        thread = threading.Thread(target=lambda: borrowed.append(pool.connection().__enter__()))
+        thread.start()
+        thread.join(timeout=0.05)
+        assert not borrowed
+    thread.join()
+    assert borrowed == [first]
+
+
+@pytest.mark.parametrize('pooled', [False, True])
+def test_manager_execute_iter_abandoned(pooled, db_port):
+    pool = ConnectionPool(host='localhost', size=1, port=db_port) if pooled else None
+    manager = Manager(host='localhost', port=db_port, pool=pool)
+    rows = manager.execute_iter('SELECT number FROM system.numbers LIMIT 100000',
+                                settings={'max_block_size': 10})
+    for _ in rows:
+        break
+    rows.close()
+    assert manager.execute('SELECT 1') == [(1,)]
+    manager.disconnect()
+    if pool is not None:
+        pool.disconnect()
+
+
+def test_manager_tracker_shares_pool(client, db_port):
+    manager = Manager(host='localhost', port=db_port)
+    trackers = [
+        manager.tracker('test_manager_tracker_shares_pool_{}'.format(idx), sync_step=10)
+        for idx in range(5)]
+    for tracker in trackers:
+        assert tracker.pool is manager.pool
+        tracker.trace('value', 1, step=0)
+        tracker.close()
+    assert manager.pool.created == 1
+    for tracker in trackers:
+        assert client.execute('SELECT count(*) FROM {}'.format(tracker.table))[0][0] == 1
+        manager.remove_experiment(tracker.table)
+    manager.disconnect()
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from rarog.reducers import REDUCERS
+
+
+VALUES = [3.0, 1.0, 4.0, 1.5, 9.0]
+
+
+@pytest.mark.parametrize('name,expected', [
+    ('mean', np.mean(VALUES)),
+    ('sum', np.sum(VALUES)),
+    ('min', np.min(VALUES)),
+    ('max', np.max(VALUES)),
+    ('last', VALUES[-1]),
+    ('count', len(VALUES)),
+    ('var', np.var(VALUES)),
+    ('std', np.std(VALUES)),
+])
+def test_reducers(name, expected):
+    reducer = REDUCERS[name]()
+    for value in VALUES:
+        reducer.update(value)
+    assert reducer.result() == pytest.approx(expected)
@@ -0,0 +1,43 @@
+from unittest import mock
+
+from rarog.samplers import EveryNth, KeepExtremes, MaxRate, Reservoir
+
+
+def trace(sampler, values):
+    kept = []
+    for step, value in enumerate(values):
+        kept.extend(sampler.update(step, value))
+    return kept + sampler.flush()
+
+
+def test_every_nth():
+    assert trace(EveryNth(3), range(10)) == [(0, 0), (3, 3), (6, 6), (9, 9)]
+
+
+def test_max_rate():
+    sampler = MaxRate(rate=2)
+    times = [0.0, 0.1, 0.4, 0.5, 0.6, 1.2]
+    with mock.patch('rarog.samplers.monotonic', side_effect=times):
+        kept = trace(sampler, range(len(times)))
+    assert kept == [(0, 0), (3, 3), (5, 5)]
+
+
+def test_reservoir():
+    kept = trace(Reservoir(size=2, window=10, seed=0), range(30))
+    assert len(kept) == 6
+    for window_start in (0, 10, 20):
+        window = [step for step, _ in kept if window_start <= step < window_start + 10]
+        assert len(window) == 2
+    assert [step for step, _ in kept] == sorted(step for step, _ in kept)
+
+
+def test_keep_extremes():
+    values = [5, 1, 5, 5, 9, 5, 5, 5, 0, 5]
+    kept = trace(KeepExtremes(EveryNth(5), window=5), values)
+    assert sorted(kept) == [(0, 5), (1, 1), (4, 9), (5, 5), (8, 0)]
+
+
+def test_keep_extremes_without_sampler():
+    values = [3, 3, 3, 3]
+    # minimum and maximum of the same step are kept once
+    assert trace(KeepExtremes(window=10), values) == [(0, 3)]
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from rarog import RarogException
+from rarog.wal import MAGIC, WriteAheadLog, read_header, read_records
+
+
+def test_write_ahead_log_records(tmpdir):
+    path = str(tmpdir.join('log'))
+    log = WriteAheadLog(path, table='experiment')
+    log.append({'first': 1}, step=0, phase='train', timestamp=10)
+    log.append({'second': np.arange(3)}, step=1, phase='val', timestamp=11)
+    records = list(log.records())
+    assert [record[1:] for _, record in records] == [(0, 'train', 10, None), (1, 'val', 11, None)]
+    assert records[0][1][0] == {'first': 1}
+    np.testing.assert_array_equal(records[1][1][0]['second'], np.arange(3))
+    log.commit(records[0][0])
+    assert [record[1] for _, record in log.records()] == [1]
+    log.close()
+    assert read_header(path) == {'table': 'experiment', 'options': {}}
+
+
+def test_write_ahead_log_reopen(tmpdir):
+    path = str(tmpdir.join('log'))
+    log = WriteAheadLog(path, table='experiment')
+    log.append({'first': 1}, step=0, phase='train', timestamp=10)
+    log.close()
+    log = WriteAheadLog(path, table='another')
+    log.append({'first': 2}, step=1, phase='train', timestamp=11)
+    log.close()
+    assert log.table == 'experiment'
+    assert [record[1] for _, record in read_records(path)] == [0, 1]
+
+
+def test_write_ahead_log_options(tmpdir):
+    path = str(tmpdir.join('log'))
+    WriteAheadLog(path, table='experiment', options={'storage': 'narrow'}).close()
+    # options of an existing log are kept
+    log = WriteAheadLog(path, table='experiment', options={'storage': 'wide'})
+    log.close()
+    assert log.options == {'storage': 'narrow'}
+
+
+def test_write_ahead_log_truncated_record(tmpdir):
+    path = str(tmpdir.join('log'))
+    log = WriteAheadLog(path, table='experiment')
+    log.append({'first': 1}, step=0, phase='train', timestamp=10)
+    log.append({'first': 2}, step=1, phase='train', timestamp=11)
+    log.close()
+    with open(path, 'rb+') as f:
+        f.truncate(tmpdir.join('log').size() - 1)
+    assert [record[1] for _, record in read_records(path)] == [0]
+    # torn frame is cut off on open, so new records are readable after it
+    log = WriteAheadLog(path, table='experiment')
+    log.append({'first': 3}, step=2, phase='train', timestamp=12)
+    log.close()
+    assert [record[1] for _, record in read_records(path)] == [0, 2]
+
+
+def test_write_ahead_log_truncated_header(tmpdir):
+    path = tmpdir.join('log')
+    path.write_binary(MAGIC[:3])
+    log = WriteAheadLog(str(path), table='experiment')
+    log.append({'first': 1}, step=0, phase='train', timestamp=10)
+    log.close()
+    assert read_header(str(path)) == {'table': 'experiment', 'options': {}}
+    assert [record[1] for _, record in read_records(str(path))] == [0]
+
+
+def test_write_ahead_log_compaction(tmpdir):
+    path = str(tmpdir.join('log'))
+    log = WriteAheadLog(path, table='experiment')
+    header_size = tmpdir.join('log').size()
+    log.append({'first': 1}, step=0, phase='train', timestamp=10)
+    log.append({'first': 2}, step=1, phase='train', timestamp=11)
+    offsets = [offset for offset, _ in log.records()]
+    log.commit(offsets[0])
+    assert tmpdir.join('log').size() > header_size
+    # all records are written, so the log is truncated to the header
+    log.commit(offsets[1])
+    assert tmpdir.join('log').size() == header_size
+    assert log.committed == header_size
+    assert not list(log.records())
+    log.close()
+    # offset was not updated after the truncation before a crash
+    tmpdir.join('log.offset').write(str(offsets[1]))
+    log = WriteAheadLog(path, table='experiment')
+    assert log.committed == header_size
+    log.append({'first': 3}, step=2, phase='train', timestamp=12)
+    assert [record[1] for _, record in log.records()] == [2]
+    log.close()
+
+
+def test_read_records_not_a_log(tmpdir):
+    path = tmpdir.join('log')
+    path.write('some text')
+    with pytest.raises(RarogException):
+        list(read_records(str(path)))